@@ -0,0 +1,91 @@
+"""Compare the batched Holt-Winters engine with the per-category statsmodels path.
+
+    python benchmarks/hw_accuracy.py --categories 200 --days 365 --holdout 28
+
+Both engines fit the same synthetic daily category series with the last
+--holdout days held back. Reports holdout MAPE and RMSE for each engine, the
+mean relative gap between their forecasts and the fit time. Writes JSON and
+exits with status 1 when the batched engine's MAPE is worse than statsmodels'
+by more than --tolerance.
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.run_benchmarks import configure
+from benchmarks.synthetic import generate_sales
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--categories', type=int, default=200)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--holdout', type=int, default=28)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tolerance', type=float, default=0.05, help='allowed relative MAPE increase of the batched engine')
+    parser.add_argument('--output', default=os.path.join(tempfile.gettempdir(), 'hw_accuracy.json'),
+                        help='results file; the system temp directory by default')
+    parser.add_argument('--database-url')
+    parser.add_argument('--redis-url', default='fake')
+    return parser.parse_args()
+
+def daily_histories(args):
+    """{category: df indexed by date with a `sales` column}, like forecast_worker.load_histories"""
+    df = generate_sales(rows=args.days * args.products, categories=args.categories, products=args.products,
+                        days=args.days, missing_rate=0.0, seed=args.seed)
+    df['Date'] = pd.to_datetime(df['Date'])
+    daily = df.groupby(['category', 'Date'])['sales'].sum()
+    return {cat: group.droplevel(0).rename_axis('date').to_frame() for cat, group in daily.groupby(level=0)}
+
+def scores(forecasts, actuals):
+    errors = forecasts - actuals
+    return {
+        'mape': float(np.mean(np.abs(errors) / np.maximum(np.abs(actuals), 1e-9))),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+    }
+
+def main():
+    args = parse_args()
+    configure(args, tempfile.mkdtemp(prefix='hw_accuracy_'))
+    from forecast_service import forecast_worker, hw_batch
+
+    histories = daily_histories(args)
+    train = {cat: df.iloc[:-args.holdout] for cat, df in histories.items()}
+    actual = {cat: df['sales'].to_numpy()[-args.holdout:] for cat, df in histories.items()}
+
+    start = time.perf_counter()
+    batched = hw_batch.forecast_many(train, args.holdout)
+    batched_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reference = {cat: forecast_worker.forecast_holt_winters(df, args.holdout) for cat, df in train.items()}
+    reference_seconds = time.perf_counter() - start
+
+    cats = [cat for cat in histories if reference[cat] is not None and batched.get(cat) is not None]
+    b = np.array([batched[cat]['forecast'].to_numpy() for cat in cats])
+    s = np.array([reference[cat]['forecast'].to_numpy() for cat in cats])
+    a = np.array([actual[cat] for cat in cats])
+
+    results = {
+        'series': len(cats),
+        'holdout_days': args.holdout,
+        'batched': {**scores(b, a), 'seconds': round(batched_seconds, 3)},
+        'statsmodels': {**scores(s, a), 'seconds': round(reference_seconds, 3)},
+        'mean_relative_gap': float(np.mean(np.abs(b - s) / np.maximum(np.abs(s), 1e-9))),
+        'speedup': round(reference_seconds / batched_seconds, 1),
+    }
+    print(json.dumps(results, indent=2))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if results['batched']['mape'] > results['statsmodels']['mape'] * (1 + args.tolerance):
+        print('Batched engine is less accurate than statsmodels beyond tolerance')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
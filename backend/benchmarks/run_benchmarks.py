@@ -0,0 +1,464 @@
+"""Benchmark ingestion, forecasting, API reads and API serving throughput on synthetic data.
+
+    python benchmarks/run_benchmarks.py --rows 200000 --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --compare results.json
+
+Runs against a throwaway SQLite database and fakeredis unless --database-url
+and --redis-url point at real services. The ETL and forecast writes use MySQL
+upserts, so on SQLite ingestion is measured without the database write
+(parse, impute and record building) and the tables are seeded with plain
+inserts instead. Results are written as JSON; --compare exits with status 1
+when a metric is worse than the baseline by more than --tolerance.
+
+The throughput suite (not run by default) starts the API as a real server,
+once with Flask's development server and once with gunicorn.conf.py, and
+drives it with --concurrency reading clients while another client keeps
+uploading the synthetic CSV.
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import argparse
+import json
+import http.client
+import platform
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import redis
+from benchmarks.synthetic import write_sales_csv
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--missing-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='defaults to a SQLite file in a temporary directory')
+    parser.add_argument('--redis-url', default='fake', help="'fake' uses an in-process fakeredis")
+    parser.add_argument('--suites', default='ingest,forecast,api,startup')
+    parser.add_argument('--forecast-categories', type=int, default=3, help='categories fitted per model')
+    parser.add_argument('--api-requests', type=int, default=200, help='requests per endpoint and cache mode')
+    parser.add_argument('--servers', default='dev,gunicorn', help='servers measured by the throughput suite')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent reading clients in the throughput suite')
+    parser.add_argument('--throughput-seconds', type=float, default=10.0, help='load duration per server')
+    parser.add_argument('--output', default=os.path.join(tempfile.gettempdir(), 'benchmark_results.json'),
+                        help='results file; the system temp directory by default')
+    parser.add_argument('--compare', help='baseline results file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown before a metric counts as a regression')
+    return parser.parse_args()
+
+def configure(args, workdir):
+    """Point the services at the benchmark database, upload dir and Redis before they are imported"""
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    os.environ['UPLOAD_DIR'] = workdir
+    if args.redis_url == 'fake':
+        import fakeredis
+        client = fakeredis.FakeRedis()
+        redis.from_url = lambda *a, **k: client
+    else:
+        os.environ['REDIS_URL'] = args.redis_url
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) if samples else None
+
+def seed_tables(engine, df, batch_num):
+    """Plain inserts for databases without ON DUPLICATE KEY UPDATE"""
+    from common.models import InvoiceData, DailyCategorySales
+    rows = pd.DataFrame({
+        'date': pd.to_datetime(df['Date']).dt.date,
+        'product_id': df['product_id'],
+        'category': df['category'],
+        'sales': df['sales'].fillna(0.0),
+        'is_imputed': df['sales'].isna(),
+        'batch_num': batch_num,
+        'file_hash': batch_num,
+        'version': 1,
+    })
+    daily = rows.groupby(['category', 'date'], as_index=False)['sales'].sum()
+    with engine.begin() as conn:
+        records = rows.to_dict('records')
+        for start in range(0, len(records), 10000):
+            conn.execute(InvoiceData.__table__.insert(), records[start:start + 10000])
+        conn.execute(DailyCategorySales.__table__.insert(), daily.to_dict('records'))
+
+def bench_ingest(args, workdir, engine):
+    from common import metrics
+    from common.db import SessionLocal
+    from common.models import UploadMetadata
+    from etl_service import etl_worker
+
+    filename = 'bench.csv'
+    path = os.path.join(workdir, filename)
+    rows = write_sales_csv(path, rows=args.rows, categories=args.categories, products=args.products,
+                           days=args.days, missing_rate=args.missing_rate, seed=args.seed)
+    batch_num = 'bench_batch'
+    db = SessionLocal()
+    db.add(UploadMetadata(batch_num=batch_num, original_filename=filename, stored_filename=filename,
+                          file_hash=batch_num, status='uploaded'))
+    db.commit()
+    db.close()
+
+    metrics.REGISTRY.timers.clear()
+    if engine.dialect.name == 'mysql':
+        mode = 'full'
+        start = time.perf_counter()
+        etl_worker.process_batch(batch_num, filename)
+        elapsed = time.perf_counter() - start
+    else:
+        mode = 'cpu-only'
+        metadata = etl_worker.DB.get(UploadMetadata, batch_num)
+        start = time.perf_counter()
+        carry = None
+        for df in metrics.timed(etl_worker.read_chunks(path), 'etl_stage', stage='parse'):
+            with metrics.timer('etl_stage', stage='impute'):
+                carry = etl_worker.impute(df, carry)
+            with metrics.timer('etl_stage', stage='records'):
+                etl_worker.to_records(df, metadata)
+        elapsed = time.perf_counter() - start
+        seed_tables(engine, pd.read_csv(path), batch_num)
+
+    stages = {labels['stage']: round(total, 4)
+              for name, labels, (count, total, worst) in metrics.REGISTRY.snapshot()['timers']
+              if name == 'etl_stage'}
+    return {
+        'mode': mode,
+        'rows': rows,
+        'seconds': round(elapsed, 4),
+        'rows_per_sec': round(rows / elapsed, 1),
+        'stage_seconds': stages,
+    }, batch_num
+
+def bench_forecast(args, engine, batch_num):
+    from common.models import ForecastData
+    from forecast_service import forecast_worker
+
+    categories = forecast_worker.batch_categories(batch_num)[:args.forecast_categories]
+    histories = forecast_worker.load_histories(categories)
+    result = {'categories': len(histories), 'models': {}}
+    saved = {cat: {} for cat in histories}
+    for model_type in forecast_worker.MODELS:
+        cold, warm = [], []
+        for cat, df in histories.items():
+            start = time.perf_counter()
+            fitted = forecast_worker.run_model(model_type, df, forecast_worker.HORIZON)
+            cold.append(time.perf_counter() - start)
+            saved[cat][model_type] = fitted
+            state = fitted.attrs.get('model_state') if fitted is not None else None
+            if state is not None:
+                start = time.perf_counter()
+                forecast_worker.run_model(model_type, df, forecast_worker.HORIZON, state)
+                warm.append(time.perf_counter() - start)
+        result['models'][model_type] = {
+            'seconds_per_category': round(float(np.mean(cold)), 4) if cold else None,
+            'warm_seconds_per_category': round(float(np.mean(warm)), 4) if warm else None,
+        }
+
+    start = time.perf_counter()
+    for cat, results in saved.items():
+        if engine.dialect.name == 'mysql':
+            forecast_worker.save_forecasts(batch_num, cat, results)
+        else:
+            rows = forecast_worker.forecast_rows(batch_num, cat, results)
+            if rows:
+                with engine.begin() as conn:
+                    conn.execute(ForecastData.__table__.insert(), rows)
+    result['write_seconds_per_category'] = round((time.perf_counter() - start) / max(len(saved), 1), 4)
+    return result
+
+def bench_api(args):
+    from common.cache import bump_versions
+    from upload_service.app import app, r
+
+    client = app.test_client()
+    endpoints = {
+        'metadata': '/metadata',
+        'invoice_data_first_page': '/invoice-data?limit=100',
+        'invoice_data_deep_page': '/invoice-data?limit=100&page=50',
+        'invoice_data_cursor': '/invoice-data?limit=100&cursor=',
+        'invoice_data_category': '/invoice-data?limit=100&category=C0',
+        'categories': '/categories',
+        'daily_sales': '/daily-sales?category=C0&limit=60',
+        'forecast_data': '/forecast-data?category=C0',
+    }
+    result = {}
+    for name, url in endpoints.items():
+        for cache in ('cold', 'warm'):
+            samples = []
+            for _ in range(args.api_requests):
+                if cache == 'cold':
+                    # Outside the timed region: invalidate cached responses and counts
+                    bump_versions(r, ['metadata', 'forecast:C0', 'forecast:*'])
+                    for key in r.scan_iter(match='invoice_count:*'):
+                        r.delete(key)
+                start = time.perf_counter()
+                response = client.get(url)
+                samples.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{url} returned {response.status_code}')
+            result[f'{name}.{cache}'] = {
+                'p50_ms': round(percentile(samples, 50) * 1000, 3),
+                'p99_ms': round(percentile(samples, 99) * 1000, 3),
+            }
+    return result
+
+STARTUP_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {backend!r})
+from forecast_service import forecast_worker
+imported = time.perf_counter()
+import numpy as np, pandas as pd
+df = pd.DataFrame({{'sales': np.arange(60) % 7 + 1.0}}, index=pd.date_range('2024-01-01', periods=60, name='date'))
+forecast_worker.run_model('prophet', df, 7)
+first = time.perf_counter()
+forecast_worker.run_model('prophet', df, 7)
+print(json.dumps({{
+    'import_seconds': round(imported - start, 4),
+    'first_prophet_fit_seconds': round(first - imported, 4),
+    'warm_prophet_fit_seconds': round(time.perf_counter() - first, 4),
+}}))
+'''
+
+def bench_startup():
+    """Cold start of a forecast worker in a fresh interpreter: module import, first and second Prophet fit"""
+    backend = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', STARTUP_PROBE.format(backend=backend)])
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result['process_seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+SERVE_PROBE = '''
+import os, sys
+sys.path.insert(0, {backend!r})
+os.chdir({backend!r})
+if {fake_redis!r}:
+    import fakeredis, redis
+    client = fakeredis.FakeRedis()
+    redis.from_url = lambda *a, **k: client
+if {server!r} == 'dev':
+    from upload_service.app import app
+    app.run(host='127.0.0.1', port={port!r})
+else:
+    from gunicorn.app.wsgiapp import run
+    sys.argv = ['gunicorn', '-c', 'gunicorn.conf.py', '-b', '127.0.0.1:{port}', 'upload_service.app:app']
+    run()
+'''
+
+THROUGHPUT_ENDPOINTS = [
+    '/invoice-data?limit=100',
+    '/invoice-data?limit=100&cursor=',
+    '/invoice-data?limit=100&category=C0',
+    '/daily-sales?category=C0&limit=60',
+    '/forecast-data?category=C0',
+    '/categories',
+    '/metadata',
+]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_serving(port, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'server exited with status {proc.returncode}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not come up within {timeout}s')
+
+def multipart_upload(path):
+    """(body, content type) of a multipart form posting `path` as `file` under a unique name"""
+    boundary = uuid.uuid4().hex
+    with open(path, 'rb') as f:
+        content = f.read()
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="load_{boundary[:8]}.csv"\r\n'
+            'Content-Type: text/csv\r\n\r\n').encode()
+    return head + content + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+def drive(port, args, csv_path):
+    """Run reading clients and one uploading client against a server for --throughput-seconds"""
+    deadline = time.perf_counter() + args.throughput_seconds
+    latencies, errors, uploads = [], [0], [0]
+    lock = threading.Lock()
+
+    def reader(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        i = offset
+        while time.perf_counter() < deadline:
+            url = THROUGHPUT_ENDPOINTS[i % len(THROUGHPUT_ENDPOINTS)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', url)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                ok = False
+            with lock:
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[0] += 1
+        conn.close()
+
+    def uploader():
+        while time.perf_counter() < deadline:
+            # A fresh file name but the same content: the server streams and hashes it, then rejects it as a duplicate
+            body, content_type = multipart_upload(csv_path)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+            try:
+                conn.request('POST', '/upload', body=body, headers={'Content-Type': content_type})
+                conn.getresponse().read()
+                uploads[0] += 1
+            except (OSError, http.client.HTTPException):
+                pass
+            finally:
+                conn.close()
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(args.concurrency)]
+    threads.append(threading.Thread(target=uploader))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'errors': errors[0],
+        'uploads': uploads[0],
+    }
+
+def bench_throughput(args, workdir):
+    """Read throughput and latency under concurrent uploads, per server"""
+    backend = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    csv_path = os.path.join(workdir, 'bench.csv')
+    result = {}
+    for server in args.servers.split(','):
+        port = free_port()
+        probe = SERVE_PROBE.format(backend=backend, fake_redis=args.redis_url == 'fake', server=server, port=port)
+        proc = subprocess.Popen([sys.executable, '-c', probe], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_serving(port, proc)
+            result[server] = drive(port, args, csv_path)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=60)
+    return result
+
+def flatten(results):
+    """Comparable metrics as {name: (value, better)} where better is 'higher' or 'lower'"""
+    flat = {}
+    ingest = results.get('ingest')
+    if ingest:
+        flat['ingest.rows_per_sec'] = (ingest['rows_per_sec'], 'higher')
+    for model_type, values in results.get('forecast', {}).get('models', {}).items():
+        for key, value in values.items():
+            if value is not None:
+                flat[f'forecast.{model_type}.{key}'] = (value, 'lower')
+    for name, values in results.get('api', {}).items():
+        for key, value in values.items():
+            flat[f'api.{name}.{key}'] = (value, 'lower')
+    for key, value in results.get('startup', {}).items():
+        flat[f'startup.{key}'] = (value, 'lower')
+    for server, values in results.get('throughput', {}).items():
+        flat[f'throughput.{server}.requests_per_sec'] = (values['requests_per_sec'], 'higher')
+        for key in ('p50_ms', 'p99_ms'):
+            if values[key] is not None:
+                flat[f'throughput.{server}.{key}'] = (values[key], 'lower')
+    return flat
+
+def compare(results, baseline, tolerance):
+    """Print metrics that got worse than the baseline by more than `tolerance`; returns their count"""
+    current = flatten(results)
+    regressions = 0
+    for name, (old, better) in flatten(baseline).items():
+        if name not in current or not old:
+            continue
+        new = current[name][0]
+        change = (new - old) / old if better == 'lower' else (old - new) / old
+        if change > tolerance:
+            regressions += 1
+            print(f'REGRESSION {name}: {old} -> {new} ({change:+.0%})')
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def main():
+    args = parse_args()
+    suites = set(args.suites.split(','))
+    workdir = tempfile.mkdtemp(prefix='sales_bench_')
+    configure(args, workdir)
+
+    from common.db import engine
+    from common.models import Base
+    Base.metadata.create_all(bind=engine)
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'database': engine.dialect.name,
+            'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'database_url', 'redis_url')},
+        }
+    }
+    # Every suite needs loaded data, so ingestion always runs; it is only reported when asked for
+    ingest, batch_num = bench_ingest(args, workdir, engine)
+    if 'ingest' in suites:
+        results['ingest'] = ingest
+        print(f"ingest ({ingest['mode']}): {ingest['rows_per_sec']} rows/s")
+    if 'forecast' in suites:
+        results['forecast'] = bench_forecast(args, engine, batch_num)
+        for model_type, values in results['forecast']['models'].items():
+            print(f"forecast {model_type}: {values}")
+    if 'api' in suites:
+        results['api'] = bench_api(args)
+        for name, values in results['api'].items():
+            print(f"api {name}: {values}")
+
+    if 'startup' in suites:
+        results['startup'] = bench_startup()
+        print(f"startup: {results['startup']}")
+    if 'throughput' in suites:
+        results['throughput'] = bench_throughput(args, workdir)
+        for server, values in results['throughput'].items():
+            print(f"throughput {server}: {values}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+def generate_sales(rows, categories=20, products=500, days=365, missing_rate=0.02, start='2023-01-01', seed=42):
+    """Synthetic invoice rows in upload format (Date, product_id, category, sales), sorted by date.
+
+    Each (date, product) pair appears at most once, so `rows` is capped at
+    days * products. Products belong to one category each; sales follow a
+    per-category level with weekly seasonality and noise, and `missing_rate`
+    of them are left empty for the ETL to impute.
+    """
+    rng = np.random.default_rng(seed)
+    rows = min(rows, days * products)
+    cells = np.sort(rng.choice(days * products, size=rows, replace=False))
+    day = cells // products
+    product = cells % products
+    category = product % categories
+
+    level = rng.uniform(20, 500, size=categories)
+    weekly = 1 + 0.3 * np.sin(2 * np.pi * np.arange(7) / 7)
+    dates = pd.Timestamp(start) + pd.to_timedelta(day, unit='D')
+    sales = level[category] * weekly[dates.dayofweek] * rng.lognormal(0, 0.25, size=rows)
+    sales = np.round(sales, 2)
+    sales[rng.random(rows) < missing_rate] = np.nan
+
+    return pd.DataFrame({
+        'Date': dates.strftime('%Y-%m-%d'),
+        'product_id': np.char.add('P', product.astype(str)),
+        'category': np.char.add('C', category.astype(str)),
+        'sales': sales,
+    })
+
+def write_sales_csv(path, **options):
+    """Write generate_sales(**options) to `path`; returns the number of rows written"""
+    df = generate_sales(**options)
+    df.to_csv(path, index=False)
+    return len(df)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import redis
+
+CACHE_TTL = int(os.getenv('API_CACHE_TTL', '300'))
+LOCAL_CACHE_SIZE = int(os.getenv('API_LOCAL_CACHE_SIZE', '256'))
+# Local entries cannot see version bumps from the workers, so they expire quickly
+LOCAL_CACHE_TTL = int(os.getenv('API_LOCAL_CACHE_TTL', '30'))
+
+def version_key(scope):
+    return f'cache_version:{scope}'
+
+def bump_versions(client, scopes):
+    """Invalidate every cached response that depends on one of the given scopes"""
+    try:
+        pipe = client.pipeline()
+        for scope in scopes:
+            pipe.incr(version_key(scope))
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Cache invalidation failed for {scopes}: {e}")
+
+class LocalLRU:
+    """Small thread-safe LRU with per-entry expiry, used when Redis is unreachable"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+class ResponseCache:
+    """Read-through cache of serialized API responses.
+
+    Keys embed the current version of the scope they depend on (for example
+    `forecast:<category>`), so bumping that version makes every older entry
+    unreachable; stale entries then age out through their TTL.
+    """
+
+    def __init__(self, client, ttl=CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.local = LocalLRU(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+
+    def key(self, namespace, scope, params):
+        """Build the cache key for a request; call once and reuse it for get and set"""
+        try:
+            version = int(self.client.get(version_key(scope)) or 0)
+        except redis.RedisError:
+            version = 'local'
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+        return f'cache:{namespace}:{scope}:{version}:{digest}'
+
+    def get(self, key):
+        try:
+            value = self.client.get(key)
+            return value.decode('utf-8') if value is not None else None
+        except redis.RedisError:
+            return self.local.get(key)
+
+    def set(self, key, body):
+        try:
+            self.client.setex(key, self.ttl, body)
+        except redis.RedisError:
+            self.local.set(key, body)
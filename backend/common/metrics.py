@@ -0,0 +1,130 @@
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+import redis
+
+# How often a process publishes its snapshot to Redis, and how long a snapshot outlives its process
+METRICS_PUSH_INTERVAL = int(os.getenv('METRICS_PUSH_INTERVAL', '15'))
+METRICS_TTL = int(os.getenv('METRICS_TTL', '120'))
+# Queues whose depth is reported, together with their processing lists
+QUEUES = ('etl_queue', 'forecast_queue', 'forecast_items', 'forecast_priority')
+
+INSTANCE = f'{socket.gethostname()}:{os.getpid()}'
+
+def snapshot_key(service, instance=INSTANCE):
+    return f'metrics:{service}:{instance}'
+
+class Registry:
+    """Process-local counters and timers, each identified by a name and a set of labels.
+
+    Timers keep count, sum and max of the observed durations in seconds, which
+    is enough for rates, averages and worst cases without bucketing.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+        self.pushed_at = 0
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            count, total, worst = self.timers.get(key, (0, 0.0, 0.0))
+            self.timers[key] = (count + 1, total + seconds, max(worst, seconds))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, iterable, name, **labels):
+        """Yield from `iterable`, timing how long each item takes to produce"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(name, time.perf_counter() - start, **labels)
+            yield item
+
+    def snapshot(self):
+        """JSON-serializable copy of every series"""
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'timers': [[name, dict(labels), list(values)] for (name, labels), values in self.timers.items()],
+            }
+
+    def push(self, client, service, force=False):
+        """Publish the snapshot to Redis at most every METRICS_PUSH_INTERVAL seconds"""
+        now = time.monotonic()
+        if not force and now - self.pushed_at < METRICS_PUSH_INTERVAL:
+            return
+        self.pushed_at = now
+        try:
+            client.setex(snapshot_key(service), METRICS_TTL, json.dumps(self.snapshot()))
+        except redis.RedisError as e:
+            print(f"Metrics push failed: {e}")
+
+REGISTRY = Registry()
+increment = REGISTRY.increment
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+timed = REGISTRY.timed
+push = REGISTRY.push
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in sorted(labels.items()))
+    return '{' + pairs + '}'
+
+def render(client):
+    """Prometheus text exposition of every pushed snapshot plus current queue depths"""
+    families = {}
+
+    def add(family, kind, name, labels, value):
+        families.setdefault((family, kind), []).append(f'{name}{_labels(labels)} {value}')
+
+    for key in client.scan_iter(match='metrics:*', count=100):
+        raw = client.get(key)
+        if raw is None:
+            continue
+        _, service, instance = key.decode('utf-8').split(':', 2)
+        snapshot = json.loads(raw)
+        for name, labels, value in snapshot['counters']:
+            labels = {**labels, 'service': service, 'instance': instance}
+            add(f'{name}_total', 'counter', f'{name}_total', labels, value)
+        for name, labels, (count, total, worst) in snapshot['timers']:
+            labels = {**labels, 'service': service, 'instance': instance}
+            add(f'{name}_seconds', 'summary', f'{name}_seconds_count', labels, count)
+            add(f'{name}_seconds', 'summary', f'{name}_seconds_sum', labels, f'{total:.6f}')
+            add(f'{name}_seconds_max', 'gauge', f'{name}_seconds_max', labels, f'{worst:.6f}')
+
+    for queue in QUEUES:
+        add('queue_depth', 'gauge', 'queue_depth', {'queue': queue}, client.llen(queue))
+        add('queue_processing', 'gauge', 'queue_processing', {'queue': queue}, client.llen(f'{queue}:processing'))
+
+    lines = []
+    for (name, kind), samples in families.items():
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
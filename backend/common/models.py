@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Date, DateTime, DECIMAL, Boolean, Enum, Text, UniqueConstraint
+from sqlalchemy import Column, String, Integer, Date, DateTime, DECIMAL, Double, Boolean, Enum, Text, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 
@@ -31,16 +31,83 @@ class InvoiceData(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     version = Column(Integer, default=1)
+    # The table is range-partitioned by date on MySQL (see sql/init.sql and init_db.py)
+    __table_args__ = (
+        Index('idx_category_date', 'category', 'date', 'product_id', 'sales'),
+        Index('idx_batch_keys', 'batch_num', 'category', 'date'),
+    )
+
+class DailyCategorySales(Base):
+    __tablename__ = 'daily_category_sales'
+    category = Column(String(100), primary_key=True)
+    date = Column(Date, primary_key=True)
+    sales = Column(DECIMAL(14,2), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
 class ForecastData(Base):
     __tablename__ = 'forecast_data'
     id = Column(Integer, primary_key=True)
     forecast_date = Column(Date, nullable=False)
     category = Column(String(100), nullable=False)
-    model_type = Column(Enum('prophet','sarimax','holt_winters'), nullable=False)
+    model_type = Column(Enum('prophet','sarimax','holt_winters','seasonal_naive','reconciled'), nullable=False)
     forecast_value = Column(DECIMAL(12,2), nullable=False)
     lower_bound = Column(DECIMAL(12,2))
     upper_bound = Column(DECIMAL(12,2))
     created_at = Column(DateTime, server_default=func.now())
     batch_num = Column(String(100))
-    __table_args__ = (UniqueConstraint('forecast_date', 'category', 'model_type', name='unique_forecast'),)
+    # On MySQL the primary key is (id, forecast_date) because the table is range-partitioned by
+    # forecast_date; id alone stays unique, so the ORM keeps it as the identity
+    __table_args__ = (
+        UniqueConstraint('forecast_date', 'category', 'model_type', name='unique_forecast'),
+        Index('idx_forecast_date', 'forecast_date'),
+        Index('idx_category_model_date', 'category', 'model_type', 'forecast_date'),
+    )
+
+class ModelState(Base):
+    __tablename__ = 'model_state'
+    category = Column(String(100), primary_key=True)
+    model_type = Column(Enum('sarimax','holt_winters'), primary_key=True)
+    params = Column(Text, nullable=False)
+    nobs = Column(Integer, nullable=False)
+    last_date = Column(Date, nullable=False)
+    residual_std = Column(Double)
+    full_fit_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class ForecastFingerprint(Base):
+    __tablename__ = 'forecast_fingerprint'
+    category = Column(String(100), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    batch_num = Column(String(100))
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class ModelBacktest(Base):
+    __tablename__ = 'model_backtest'
+    category = Column(String(100), primary_key=True)
+    model_type = Column(Enum('prophet','sarimax','holt_winters','seasonal_naive'), primary_key=True)
+    folds = Column(Integer, nullable=False)
+    failed_folds = Column(Integer, nullable=False, default=0)
+    horizon = Column(Integer, nullable=False)
+    mape = Column(Double)
+    rmse = Column(Double)
+    fit_seconds = Column(Double)
+    evaluated_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+class ProductForecastData(Base):
+    __tablename__ = 'product_forecast_data'
+    category = Column(String(100), primary_key=True)
+    product_id = Column(String(100), primary_key=True)
+    forecast_date = Column(Date, primary_key=True)
+    forecast_value = Column(DECIMAL(12,2), nullable=False)
+    lower_bound = Column(DECIMAL(12,2))
+    upper_bound = Column(DECIMAL(12,2))
+    reconciliation = Column(Enum('bottom_up','mint'), nullable=False)
+    batch_num = Column(String(100))
+    created_at = Column(DateTime, server_default=func.now())
+
+class EtlPartitionLedger(Base):
+    __tablename__ = 'etl_partition_ledger'
+    batch_num = Column(String(100), primary_key=True)
+    partition_num = Column(Integer, primary_key=True, autoincrement=False)
+    committed_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+# How long a reserved item may stay unacknowledged before another worker reclaims it
+LEASE_SECONDS = int(os.getenv('QUEUE_LEASE_SECONDS', '1800'))
+# How often a worker still busy with an item extends its lease
+HEARTBEAT_SECONDS = int(os.getenv('QUEUE_HEARTBEAT_SECONDS', str(max(LEASE_SECONDS // 3, 1))))
+
+def processing_key(queue):
+    return f'{queue}:processing'
+
+def item_id(payload):
+    """The id an item's lease is keyed on: its 'id' field, or a hash of the payload for items queued without one"""
+    try:
+        item = json.loads(payload)
+    except ValueError:
+        item = None
+    if isinstance(item, dict) and 'id' in item:
+        return str(item['id'])
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()
+
+def _item_key(queue, kind, payload):
+    return f'{queue}:{kind}:{item_id(payload)}'
+
+def push(client, queue, *items):
+    """Queue dict items as JSON, each with a unique 'id'; returns the payloads.
+
+    Two items with the same content are still distinct payloads, so their
+    leases and acks never interfere.
+    """
+    payloads = [json.dumps(dict(item, id=uuid.uuid4().hex), sort_keys=True) for item in items]
+    for start in range(0, len(payloads), 1000):
+        client.lpush(queue, *payloads[start:start + 1000])
+    return payloads
+
+def reserve(client, queue, timeout=5):
+    """Move the next item of `queue` to its processing list and lease it.
+
+    Blocks up to `timeout` seconds (0 means do not block). Returns the raw
+    payload, or None when the queue is empty. The item stays in the
+    processing list until ack(); if the lease expires first, reclaim()
+    puts it back on the queue.
+    """
+    if timeout:
+        payload = client.brpoplpush(queue, processing_key(queue), timeout=timeout)
+    else:
+        payload = client.rpoplpush(queue, processing_key(queue))
+    if payload is not None:
+        client.set(_item_key(queue, 'lease', payload), 1, ex=LEASE_SECONDS)
+    return payload
+
+def renew(client, queue, payload):
+    """Extend the lease of a reserved item by LEASE_SECONDS from now"""
+    pipe = client.pipeline()
+    pipe.set(_item_key(queue, 'lease', payload), 1, ex=LEASE_SECONDS)
+    pipe.delete(_item_key(queue, 'suspect', payload))
+    pipe.execute()
+
+@contextmanager
+def heartbeat(client, queue, payloads):
+    """Renew the leases of reserved `payloads` every HEARTBEAT_SECONDS while the block runs.
+
+    Renewal happens on a background thread, so a single long fit or file load
+    keeps its lease; a worker that dies stops renewing and its items are
+    reclaimed once the last lease expires.
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_SECONDS):
+            for payload in payloads:
+                try:
+                    renew(client, queue, payload)
+                except Exception as e:
+                    print(f'Lease renewal failed on {queue}: {e}')
+
+    thread = threading.Thread(target=beat, name=f'{queue}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def ack(client, queue, payload):
+    """Mark a reserved item as done"""
+    pipe = client.pipeline()
+    pipe.lrem(processing_key(queue), 1, payload)
+    pipe.delete(_item_key(queue, 'lease', payload), _item_key(queue, 'suspect', payload))
+    pipe.execute()
+
+def reclaim(client, queue):
+    """Requeue processing items whose lease has expired; returns how many were requeued.
+
+    An item without a lease is only requeued when it was already seen
+    without one on an earlier pass, so an item that was reserved but not yet
+    leased is never stolen.
+    """
+    reclaimed = 0
+    for payload in client.lrange(processing_key(queue), 0, -1):
+        if client.exists(_item_key(queue, 'lease', payload)):
+            continue
+        if client.set(_item_key(queue, 'suspect', payload), 1, nx=True, ex=LEASE_SECONDS):
+            continue
+        # LREM decides which reclaimer owns the item when several run at once
+        if client.lrem(processing_key(queue), 1, payload):
+            client.rpush(queue, payload)
+            client.delete(_item_key(queue, 'suspect', payload))
+            reclaimed += 1
+    return reclaimed
@@ -2,15 +2,46 @@ import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import ast
+import csv
+import io
+import json
+import math
 import time
 import pandas as pd
 import redis
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from common import metrics, work_queue
+from common.cache import bump_versions
 from common.db import engine, SessionLocal
 from common.models import UploadMetadata
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # columnar staging is optional
+    pa = None
+    pq = None
+
 REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 UPLOAD_DIR = os.getenv('UPLOAD_DIR', '/app/data/uploaded_files')
+# 'bulk' sends multi-row upserts in chunks; 'row' keeps the old per-row INSERT/UPDATE path
+ETL_LOAD_MODE = os.getenv('ETL_LOAD_MODE', 'bulk')
+ETL_CHUNK_SIZE = int(os.getenv('ETL_CHUNK_SIZE', '5000'))
+# Rows parsed from the CSV per read; each chunk is imputed and written before the next is read
+ETL_READ_CHUNK_ROWS = int(os.getenv('ETL_READ_CHUNK_ROWS', '100000'))
+# Files larger than this are split into byte-range partitions that several workers load in parallel
+ETL_PARTITION_BYTES = int(os.getenv('ETL_PARTITION_BYTES', str(256 * 1024 * 1024)))
+ETL_BATCH_TTL = int(os.getenv('ETL_BATCH_TTL', str(7 * 24 * 3600)))
+RECLAIM_INTERVAL = int(os.getenv('ETL_RECLAIM_INTERVAL', '60'))
+# Attempts of a partition transaction that MySQL chose as a deadlock victim or that lost its connection
+ETL_DEADLOCK_RETRIES = int(os.getenv('ETL_DEADLOCK_RETRIES', '3'))
+ETL_QUEUE = 'etl_queue'
+# Keep a typed Parquet copy of each upload next to the CSV and use it when a batch is processed again
+ETL_STAGE_COLUMNAR = os.getenv('ETL_STAGE_COLUMNAR', 'true').lower() == 'true' and pq is not None
+
+REQUIRED_COLUMNS = {'Date', 'product_id', 'category', 'sales'}
+CSV_DTYPES = {'product_id': str, 'category': str, 'sales': 'float64'}
 
 # Wait for services to be ready
 def wait_for_services():
@@ -31,136 +62,629 @@ def wait_for_services():
             time.sleep(2)
     raise Exception("Services not available after retries")
 
-wait_for_services()
-
 r = redis.from_url(REDIS_URL)
 DB = SessionLocal()
 
-def process_batch(batch_num, stored_filename):
-    metadata = DB.query(UploadMetadata).filter(UploadMetadata.batch_num == batch_num).first()
-    if not metadata:
-        print(f"metadata not found for {batch_num}")
+# Every VALUES item must be a placeholder: only then does PyMySQL's executemany
+# rewrite the statement into one multi-row INSERT instead of a query per row
+UPSERT_SQL = text("""
+INSERT INTO invoice_data (`date`, product_id, category, sales, is_imputed, batch_num, file_hash, version)
+VALUES (:date, :product_id, :category, :sales, :is_imputed, :batch_num, :file_hash, :version)
+ON DUPLICATE KEY UPDATE
+  sales = VALUES(sales),
+  is_imputed = VALUES(is_imputed),
+  batch_num = VALUES(batch_num),
+  file_hash = VALUES(file_hash),
+  version = version + 1,
+  updated_at = NOW()
+""")
+
+ROLLUP_SQL = text("""
+INSERT INTO daily_category_sales (`date`, category, sales)
+SELECT `date`, category, SUM(sales) FROM invoice_data
+WHERE (`date`, category) IN :keys
+GROUP BY `date`, category
+ON DUPLICATE KEY UPDATE
+  sales = VALUES(sales),
+  updated_at = NOW()
+""").bindparams(bindparam('keys', expanding=True))
+
+def row_dates(df):
+    """Return the Date column as python dates"""
+    return df['Date'].dt.date if pd.api.types.is_datetime64_any_dtype(df['Date']) else df['Date']
+
+def to_records(df, metadata):
+    """Convert a cleaned DataFrame into parameter dicts for invoice_data writes"""
+    records = pd.DataFrame({
+        'date': row_dates(df),
+        'product_id': df['product_id'].astype(str),
+        'category': df['category'].astype(str),
+        'sales': df['sales'].astype(float),
+        'is_imputed': df['is_imputed'].astype(bool),
+    })
+    records['batch_num'] = metadata.batch_num
+    records['file_hash'] = metadata.file_hash
+    records['version'] = 1
+    return records.to_dict('records')
+
+def upsert_bulk(conn, df, metadata):
+    """Upsert rows in chunks of ETL_CHUNK_SIZE with multi-row INSERT ... ON DUPLICATE KEY UPDATE.
+
+    MySQL reports 1 affected row per inserted row and 2 per updated row (the
+    version bump guarantees every duplicate actually changes), so the split
+    between inserts and updates is recovered from the rowcount of each chunk.
+    """
+    records = to_records(df, metadata)
+    inserted = 0
+    updated = 0
+    for start in range(0, len(records), ETL_CHUNK_SIZE):
+        chunk = records[start:start + ETL_CHUNK_SIZE]
+        res = conn.execute(UPSERT_SQL, chunk)
+        chunk_updated = res.rowcount - len(chunk)
+        updated += chunk_updated
+        inserted += len(chunk) - chunk_updated
+    return inserted, updated
+
+def upsert_rows(conn, df, metadata):
+    """Legacy per-row path: try INSERT, fall back to UPDATE on duplicate key"""
+    inserted = 0
+    updated = 0
+    for row in to_records(df, metadata):
+        try:
+            sql = text("""
+            INSERT INTO invoice_data (`date`, product_id, category, sales, is_imputed, batch_num, file_hash, version)
+            VALUES (:date, :product_id, :category, :sales, :is_imputed, :batch_num, :file_hash, 1)
+            """)
+            conn.execute(sql, row)
+            inserted += 1
+        except Exception:
+            # Update existing record
+            update_sql = text("""
+            UPDATE invoice_data SET
+              sales = :sales,
+              is_imputed = :is_imputed,
+              batch_num = :batch_num,
+              file_hash = :file_hash,
+              version = version + 1,
+              updated_at = NOW()
+            WHERE `date` = :date AND product_id = :product_id AND category = :category
+            """)
+            res = conn.execute(update_sql, row)
+            updated += res.rowcount if res is not None else 1
+    return inserted, updated
+
+def refresh_daily_totals(conn, df):
+    """Recompute daily_category_sales for exactly the (date, category) keys present in df"""
+    keys = pd.DataFrame({'date': row_dates(df), 'category': df['category'].astype(str)}).drop_duplicates()
+    keys = list(keys.itertuples(index=False, name=None))
+    for start in range(0, len(keys), ETL_CHUNK_SIZE):
+        conn.execute(ROLLUP_SQL, {'keys': keys[start:start + ETL_CHUNK_SIZE]})
+
+def read_chunks(source, **options):
+    """Yield a CSV in chunks of ETL_READ_CHUNK_ROWS rows (whole file when 0)"""
+    if ETL_READ_CHUNK_ROWS <= 0:
+        yield pd.read_csv(source, parse_dates=['Date'], dtype=CSV_DTYPES, **options)
         return
-    metadata.status = 'processing'
+    yield from pd.read_csv(source, parse_dates=['Date'], dtype=CSV_DTYPES, chunksize=ETL_READ_CHUNK_ROWS, **options)
+
+def impute(df, carry):
+    """Forward fill sales in place, then fill with 0, and flag imputed rows.
+
+    `carry` is the last non-missing sales value seen in earlier chunks; it seeds
+    the leading gap of this chunk so chunked reads impute exactly like a
+    whole-file ffill. Returns the carry for the next chunk.
+    """
+    imputed_mask = df['sales'].isna()
+    sales = df['sales'].ffill()
+    if carry is not None:
+        sales = sales.fillna(carry)
+    if sales.notna().any():
+        carry = float(sales.iloc[-1])
+    df['sales'] = sales.fillna(0)
+    df['is_imputed'] = imputed_mask
+    return carry
+
+def commit_metadata():
+    """Commit pending UploadMetadata changes and invalidate cached /metadata responses"""
     DB.commit()
+    bump_versions(r, ['metadata'])
 
-    path = os.path.join(UPLOAD_DIR, stored_filename)
+def staged_dir(stored_filename):
+    """Directory holding the Parquet parts of an upload, one per partition"""
+    return os.path.join(UPLOAD_DIR, os.path.splitext(stored_filename)[0] + '.parquet')
+
+def part_path(stored_filename, partition):
+    return os.path.join(staged_dir(stored_filename), f'part-{partition:05d}.parquet')
+
+def staged_parts(stored_filename):
+    """Sorted Parquet part paths of a completely staged upload, or None"""
+    directory = staged_dir(stored_filename)
+    if not ETL_STAGE_COLUMNAR or not os.path.exists(os.path.join(directory, '_SUCCESS')):
+        return None
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parquet'))
+
+def reset_staging(stored_filename):
+    """Drop an incomplete staging directory before the CSV is loaded again"""
+    directory = staged_dir(stored_filename)
+    if ETL_STAGE_COLUMNAR and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+    elif ETL_STAGE_COLUMNAR:
+        os.makedirs(directory)
+
+def mark_staged(stored_filename, partitions=None):
+    """Mark the staging directory complete once every partition has written its part"""
+    directory = staged_dir(stored_filename)
+    if not ETL_STAGE_COLUMNAR or not os.path.isdir(directory):
+        return
+    parts = [name for name in os.listdir(directory) if name.endswith('.parquet')]
+    if partitions is None or len(parts) == partitions:
+        open(os.path.join(directory, '_SUCCESS'), 'w').close()
+
+def stage_chunks(chunks, path):
+    """Pass raw CSV chunks through unchanged while writing them to a Parquet part.
+
+    Chunks are written before imputation so a re-run recomputes the same
+    counters. The part only appears under its final name once every chunk is
+    written; a staging error disables staging for this part but never fails the load.
+    """
+    if not ETL_STAGE_COLUMNAR:
+        yield from chunks
+        return
+    tmp_path = path + '.tmp'
+    writer = None
+    staging = True
+    try:
+        for df in chunks:
+            if staging:
+                try:
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(tmp_path, table.schema)
+                    writer.write_table(table)
+                except Exception as e:
+                    print(f"Columnar staging disabled for {path}: {e}")
+                    staging = False
+            yield df
+        if writer is not None:
+            writer.close()
+            writer = None
+            if staging:
+                os.replace(tmp_path, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def read_staged(paths):
+    """Yield DataFrame chunks from memory-mapped Parquet parts, in file order"""
+    batch_size = ETL_READ_CHUNK_ROWS if ETL_READ_CHUNK_ROWS > 0 else 1 << 20
+    for path in paths:
+        parquet = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet.iter_batches(batch_size=batch_size):
+            yield batch.to_pandas()
+
+def staged_carry_before(paths, index):
+    """Last non-missing sales value in the parts before `index`, reading only the sales column"""
+    for path in reversed(paths[:index]):
+        sales = pq.read_table(path, columns=['sales'], memory_map=True).column('sales').drop_null()
+        if len(sales):
+            return sales[-1].as_py()
+    return None
+
+def validate_header(metadata, path):
+    """Return the CSV column names, or None after marking the batch failed"""
     try:
-        df = pd.read_csv(path, parse_dates=['Date'])
+        columns = list(pd.read_csv(path, nrows=0).columns)
     except Exception as e:
         metadata.status = 'failed'
         metadata.error_log = str(e)
-        DB.commit()
-        return
+        commit_metadata()
+        return None
 
     # Validate required columns
-    required = {'Date', 'product_id', 'category', 'sales'}
-    if not required.issubset(set(df.columns)):
+    if not REQUIRED_COLUMNS.issubset(columns):
         metadata.status = 'failed'
-        metadata.error_log = f"missing columns: {required - set(df.columns)}"
-        DB.commit()
-        return
+        metadata.error_log = f"missing columns: {REQUIRED_COLUMNS - set(columns)}"
+        commit_metadata()
+        return None
+    return columns
 
-    metadata.num_total_rows = int(len(df))
-    # Count missing rows in sales
-    metadata.num_missing_rows = int(df['sales'].isna().sum())
+def load_chunks(conn, chunks, metadata, carry=None, refresh_rollup=True):
+    """Impute and upsert a stream of chunks inside the caller's transaction; returns row counters"""
+    counts = {'total': 0, 'missing': 0, 'inserted': 0, 'updated': 0}
+    for df in metrics.timed(chunks, 'etl_stage', stage='parse'):
+        counts['total'] += len(df)
+        # Count missing rows in sales
+        counts['missing'] += int(df['sales'].isna().sum())
 
-    # Imputation: forward fill then fill with 0
-    imputed_mask = df['sales'].isna()
-    df['sales'] = df['sales'].ffill().fillna(0)
-    df['is_imputed'] = imputed_mask
-    metadata.num_imputed_rows = int(imputed_mask.sum())
+        with metrics.timer('etl_stage', stage='impute'):
+            carry = impute(df, carry)
 
-    inserted = 0
-    updated = 0
+        with metrics.timer('etl_stage', stage='write'):
+            if ETL_LOAD_MODE == 'row':
+                chunk_inserted, chunk_updated = upsert_rows(conn, df, metadata)
+            else:
+                chunk_inserted, chunk_updated = upsert_bulk(conn, df, metadata)
+        counts['inserted'] += chunk_inserted
+        counts['updated'] += chunk_updated
+        if refresh_rollup:
+            with metrics.timer('etl_stage', stage='rollup'):
+                refresh_daily_totals(conn, df)
+    metrics.increment('etl_rows', counts['inserted'], outcome='inserted')
+    metrics.increment('etl_rows', counts['updated'], outcome='updated')
+    metrics.increment('etl_rows', counts['missing'], outcome='imputed')
+    return counts
+
+def process_batch(batch_num, stored_filename):
+    metadata = DB.query(UploadMetadata).filter(UploadMetadata.batch_num == batch_num).first()
+    if not metadata:
+        print(f"metadata not found for {batch_num}")
+        return
+    metadata.status = 'processing'
+    commit_metadata()
+
+    path = os.path.join(UPLOAD_DIR, stored_filename)
+    if validate_header(metadata, path) is None:
+        return
+
+    parts = staged_parts(stored_filename)
+    if parts:
+        # Re-run: skip CSV parsing entirely
+        chunks = read_staged(parts)
+    else:
+        reset_staging(stored_filename)
+        chunks = stage_chunks(read_chunks(path), part_path(stored_filename, 0))
 
     conn = engine.connect()
     trans = conn.begin()
     try:
-        for _, row in df.iterrows():
-            date = row['Date'].date() if hasattr(row['Date'], 'date') else row['Date']
-            product_id = str(row['product_id'])
-            category = str(row['category'])
-            sales = float(row['sales'])
-            is_imputed = bool(row['is_imputed'])
-
-            # Try insert, if fails do update
-            try:
-                sql = text("""
-                INSERT INTO invoice_data (`date`, product_id, category, sales, is_imputed, batch_num, file_hash, version)
-                VALUES (:date, :product_id, :category, :sales, :is_imputed, :batch_num, :file_hash, 1)
-                """)
-                conn.execute(sql, {
-                    'date': date,
-                    'product_id': product_id,
-                    'category': category,
-                    'sales': sales,
-                    'is_imputed': is_imputed,
-                    'batch_num': metadata.batch_num,
-                    'file_hash': metadata.file_hash
-                })
-                inserted += 1
-            except Exception:
-                # Update existing record
-                update_sql = text("""
-                UPDATE invoice_data SET
-                  sales = :sales,
-                  is_imputed = :is_imputed,
-                  batch_num = :batch_num,
-                  file_hash = :file_hash,
-                  version = version + 1,
-                  updated_at = NOW()
-                WHERE `date` = :date AND product_id = :product_id AND category = :category
-                """)
-                res = conn.execute(update_sql, {
-                    'sales': sales,
-                    'is_imputed': is_imputed,
-                    'batch_num': metadata.batch_num,
-                    'file_hash': metadata.file_hash,
-                    'date': date,
-                    'product_id': product_id,
-                    'category': category
-                })
-                updated += res.rowcount if res is not None else 1
-
+        counts = load_chunks(conn, chunks, metadata)
         trans.commit()
     except Exception as e:
         trans.rollback()
         metadata.status = 'failed'
         metadata.error_log = str(e)
-        DB.commit()
+        commit_metadata()
         conn.close()
         return
 
     conn.close()
-    metadata.num_inserted_rows = inserted
-    metadata.num_updated_rows = updated
+    if not parts:
+        mark_staged(stored_filename, 1)
+    metadata.num_total_rows = counts['total']
+    metadata.num_missing_rows = counts['missing']
+    metadata.num_imputed_rows = counts['missing']
+    metadata.num_inserted_rows = counts['inserted']
+    metadata.num_updated_rows = counts['updated']
     metadata.status = 'completed'
-    DB.commit()
+    commit_metadata()
 
     # push to forecast queue
-    r.lpush('forecast_queue', batch_num)
-    print(f"Processed {batch_num}: inserted={inserted} updated={updated}")
+    work_queue.push(r, 'forecast_queue', {'batch_num': batch_num})
+    print(f"Processed {batch_num}: inserted={counts['inserted']} updated={counts['updated']}")
+
+class ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of a file"""
+
+    def __init__(self, path, start, end):
+        self.handle = open(path, 'rb')
+        self.handle.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        data = self.handle.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.handle.close()
+        super().close()
+
+def header_end(path):
+    """Byte offset of the first data row"""
+    with open(path, 'rb') as f:
+        f.readline()
+        return f.tell()
+
+def partition_ranges(path, partitions):
+    """Split the data rows of a CSV into up to `partitions` byte ranges that start and end on line boundaries"""
+    size = os.path.getsize(path)
+    start = header_end(path)
+    bounds = [start]
+    step = (size - start) // partitions
+    with open(path, 'rb') as f:
+        for i in range(1, partitions):
+            f.seek(max(start + i * step, bounds[-1]))
+            # Move to the start of the next full line
+            f.readline()
+            offset = f.tell()
+            if bounds[-1] < offset < size:
+                bounds.append(offset)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def parse_sales(value):
+    """Parse a raw sales field; None for values pandas would read as missing"""
+    try:
+        sales = float(value)
+    except ValueError:
+        return None
+    return None if math.isnan(sales) else sales
+
+def carry_before(path, offset, sales_index, block_size=1 << 16):
+    """Last non-missing sales value in the rows before `offset`.
+
+    Lets a partition that starts mid-file forward fill its leading gap exactly
+    as a whole-file ffill would, by scanning backwards block by block.
+    """
+    data_start = header_end(path)
+    end = offset
+    partial = b''
+    with open(path, 'rb') as f:
+        while end > data_start:
+            begin = max(data_start, end - block_size)
+            f.seek(begin)
+            lines = (f.read(end - begin) + partial).split(b'\n')
+            # The first piece may be the tail of a line that starts in an earlier block
+            partial = lines.pop(0) if begin > data_start else b''
+            for line in reversed(lines):
+                if not line.strip():
+                    continue
+                row = next(csv.reader([line.decode('utf-8').rstrip('\r')]))
+                if len(row) > sales_index:
+                    sales = parse_sales(row[sales_index])
+                    if sales is not None:
+                        return sales
+            end = begin
+    return None
+
+COUNTERS_SQL = text("""
+UPDATE upload_metadata SET
+  num_total_rows = num_total_rows + :total,
+  num_missing_rows = num_missing_rows + :missing,
+  num_imputed_rows = num_imputed_rows + :missing,
+  num_inserted_rows = num_inserted_rows + :inserted,
+  num_updated_rows = num_updated_rows + :updated
+WHERE batch_num = :batch_num
+""")
+
+BATCH_ROLLUP_SQL = text("""
+INSERT INTO daily_category_sales (`date`, category, sales)
+SELECT i.`date`, i.category, SUM(i.sales) FROM invoice_data i
+JOIN (SELECT DISTINCT `date`, category FROM invoice_data WHERE batch_num = :batch_num) k
+  ON i.`date` = k.`date` AND i.category = k.category
+GROUP BY i.`date`, i.category
+ON DUPLICATE KEY UPDATE
+  sales = VALUES(sales),
+  updated_at = NOW()
+""")
+
+# Committed partitions of a batch, recorded in the transaction that loads them
+LEDGER_INSERT_SQL = text(
+    'INSERT INTO etl_partition_ledger (batch_num, partition_num) VALUES (:batch_num, :partition_num)'
+)
+LEDGER_RESET_SQL = text('DELETE FROM etl_partition_ledger WHERE batch_num = :batch_num')
+
+def batch_key(batch_num):
+    return f'etl_batch:{batch_num}'
+
+# MySQL errors after which a partition transaction is retried: deadlock, server gone away, lost connection
+RETRYABLE_ERRORS = (1213, 2006, 2013)
+
+def is_retryable(error):
+    return isinstance(error, OperationalError) and getattr(error.orig, 'args', (None,))[0] in RETRYABLE_ERRORS
+
+def plan_partitions(batch_num, stored_filename, plan_id=None):
+    """Split a large upload into byte-range partition jobs on etl_queue.
+
+    The partition jobs are queued together with a marker holding the id of the
+    plan job, so a redelivered plan job leaves the counters, ledger and queued
+    partitions of its batch alone. A new plan job, e.g. from reprocess, starts
+    the batch over.
+    """
+    key = batch_key(batch_num)
+    if plan_id is not None and r.get(f'{key}:planned') == str(plan_id).encode('utf-8'):
+        print(f"{batch_num} is already planned, skipping")
+        return
+    metadata = DB.query(UploadMetadata).filter(UploadMetadata.batch_num == batch_num).first()
+    if not metadata:
+        print(f"metadata not found for {batch_num}")
+        return
+    metadata.status = 'processing'
+    metadata.num_total_rows = 0
+    metadata.num_missing_rows = 0
+    metadata.num_imputed_rows = 0
+    metadata.num_inserted_rows = 0
+    metadata.num_updated_rows = 0
+    commit_metadata()
+    with engine.begin() as conn:
+        conn.execute(LEDGER_RESET_SQL, {'batch_num': batch_num})
+
+    path = os.path.join(UPLOAD_DIR, stored_filename)
+    if validate_header(metadata, path) is None:
+        return
+
+    parts = staged_parts(stored_filename)
+    if parts:
+        # Re-run: one partition per staged Parquet part
+        ranges = [{'part': os.path.basename(part)} for part in parts]
+    else:
+        reset_staging(stored_filename)
+        partitions = math.ceil(os.path.getsize(path) / ETL_PARTITION_BYTES)
+        ranges = [{'start': start, 'end': end} for start, end in partition_ranges(path, partitions)]
+
+    jobs = [{
+        'batch_num': batch_num,
+        'stored_filename': stored_filename,
+        'partition': i,
+        'partitions': len(ranges),
+        **source
+    } for i, source in enumerate(ranges)]
+    pipe = r.pipeline()
+    pipe.delete(f'{key}:done', f'{key}:finalized')
+    pipe.hset(key, mapping={'partitions': len(ranges)})
+    pipe.expire(key, ETL_BATCH_TTL)
+    work_queue.push(pipe, ETL_QUEUE, *jobs)
+    if plan_id is not None:
+        pipe.set(f'{key}:planned', plan_id, ex=ETL_BATCH_TTL)
+    pipe.execute()
+    print(f"Split {batch_num} into {len(ranges)} partitions")
+
+def load_partition(conn, job, metadata):
+    """Load the rows of one partition job on `conn`; returns the counters"""
+    # The daily rollup is refreshed once for the whole batch after the last partition
+    if 'part' in job:
+        parts = sorted(
+            os.path.join(staged_dir(job['stored_filename']), name)
+            for name in os.listdir(staged_dir(job['stored_filename'])) if name.endswith('.parquet')
+        )
+        index = parts.index(os.path.join(staged_dir(job['stored_filename']), job['part']))
+        carry = staged_carry_before(parts, index)
+        return load_chunks(conn, read_staged([parts[index]]), metadata, carry, refresh_rollup=False)
+    path = os.path.join(UPLOAD_DIR, job['stored_filename'])
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    carry = carry_before(path, job['start'], columns.index('sales')) if job['partition'] else None
+    with io.BufferedReader(ByteRange(path, job['start'], job['end'])) as source:
+        chunks = stage_chunks(read_chunks(source, header=None, names=columns), part_path(job['stored_filename'], job['partition']))
+        return load_chunks(conn, chunks, metadata, carry, refresh_rollup=False)
+
+def process_partition(job):
+    """Load one partition of an upload and add its counters to UploadMetadata.
+
+    The partition is recorded in etl_partition_ledger in the same transaction,
+    so a redelivered job (a crash before the ack, or a second worker after the
+    lease ran out) finds it there and skips the load instead of counting it twice.
+    A transaction chosen as a deadlock victim or cut off from the server is
+    retried, from the ledger insert on.
+    """
+    batch_num = job['batch_num']
+    metadata = DB.query(UploadMetadata).filter(UploadMetadata.batch_num == batch_num).first()
+    if not metadata:
+        print(f"metadata not found for {batch_num}")
+        return
+
+    for attempt in range(1, ETL_DEADLOCK_RETRIES + 1):
+        claimed = False
+        try:
+            # Commits on success; rolls back and closes the connection on any error
+            with engine.begin() as conn:
+                # Claimed first: a concurrent run of the same partition waits on this row and then finds it taken
+                conn.execute(LEDGER_INSERT_SQL, {'batch_num': batch_num, 'partition_num': job['partition']})
+                claimed = True
+                counts = load_partition(conn, job, metadata)
+                conn.execute(COUNTERS_SQL, {**counts, 'batch_num': batch_num})
+            print(f"Processed {batch_num} partition {job['partition'] + 1}/{job['partitions']}: {counts}")
+            break
+        except Exception as e:
+            if isinstance(e, IntegrityError) and not claimed:
+                print(f"Partition {job['partition']} of {batch_num} was already loaded, skipping")
+                break
+            if is_retryable(e) and attempt < ETL_DEADLOCK_RETRIES:
+                print(f"Retrying {batch_num} partition {job['partition']} after {e} ({attempt}/{ETL_DEADLOCK_RETRIES})")
+                time.sleep(attempt)
+                continue
+            metadata.status = 'failed'
+            metadata.error_log = '\n'.join(filter(None, [metadata.error_log, f"partition {job['partition']}: {e}"]))
+            commit_metadata()
+            return
+    bump_versions(r, ['metadata'])
+
+    key = batch_key(batch_num)
+    r.sadd(f'{key}:done', job['partition'])
+    r.expire(f'{key}:done', ETL_BATCH_TTL)
+    # Exactly one worker finalizes, even if the last partitions finish together
+    if r.scard(f'{key}:done') >= job['partitions'] and r.set(f'{key}:finalized', 1, nx=True, ex=ETL_BATCH_TTL):
+        if 'part' not in job:
+            mark_staged(job['stored_filename'], job['partitions'])
+        finalize_partitions(batch_num)
+
+def finalize_partitions(batch_num):
+    """Refresh the daily rollup for the batch and mark it completed unless a partition failed"""
+    with engine.begin() as conn, metrics.timer('etl_stage', stage='rollup'):
+        conn.execute(BATCH_ROLLUP_SQL, {'batch_num': batch_num})
+        res = conn.execute(
+            text("UPDATE upload_metadata SET status = 'completed' WHERE batch_num = :batch_num AND status = 'processing'"),
+            {'batch_num': batch_num}
+        )
+    bump_versions(r, ['metadata'])
+    if res.rowcount:
+        work_queue.push(r, 'forecast_queue', {'batch_num': batch_num})
+        print(f"Completed partitioned batch {batch_num}")
+
+def parse_job(raw):
+    """Decode an etl_queue payload; str(dict) payloads queued by older API versions are still accepted"""
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return ast.literal_eval(raw)
+
+def handle_job(job):
+    batch_num = job.get('batch_num')
+    stored_filename = job.get('stored_filename')
+    if 'partition' in job:
+        print(f"Processing job: batch_num={batch_num}, partition={job['partition']}")
+        process_partition(job)
+        return
+    print(f"Processing job: batch_num={batch_num}, file={stored_filename}")
+    path = os.path.join(UPLOAD_DIR, stored_filename)
+    parts = staged_parts(stored_filename)
+    if parts:
+        partitioned = len(parts) > 1
+    else:
+        partitioned = os.path.exists(path) and os.path.getsize(path) > ETL_PARTITION_BYTES
+    if partitioned:
+        plan_partitions(batch_num, stored_filename, job.get('id'))
+    else:
+        process_batch(batch_num, stored_filename)
 
+def reprocess(batch_num):
+    """Queue an already uploaded batch for loading again (served from its staged Parquet copy if present)"""
+    metadata = DB.query(UploadMetadata).filter(UploadMetadata.batch_num == batch_num).first()
+    if not metadata:
+        print(f"metadata not found for {batch_num}")
+        return
+    job = {'batch_num': batch_num, 'stored_filename': metadata.stored_filename}
+    work_queue.push(r, ETL_QUEUE, job)
+    print(f"Queued {batch_num} for re-processing")
 
 if __name__ == '__main__':
+    wait_for_services()
+    if len(sys.argv) == 3 and sys.argv[1] == 'reprocess':
+        reprocess(sys.argv[2])
+        sys.exit(0)
+
     print("ETL worker started, waiting for jobs...")
+    last_reclaim = 0
     while True:
         try:
-            item = r.brpop('etl_queue', timeout=5)
-            if item:
-                # item is (queue_name, value)
-                raw = item[1].decode('utf-8')
+            if time.time() - last_reclaim > RECLAIM_INTERVAL:
+                reclaimed = work_queue.reclaim(r, ETL_QUEUE)
+                if reclaimed:
+                    print(f"Reclaimed {reclaimed} stale jobs from {ETL_QUEUE}")
+                last_reclaim = time.time()
+
+            payload = work_queue.reserve(r, ETL_QUEUE, timeout=5)
+            if payload:
+                raw = payload.decode('utf-8')
                 try:
-                    job = ast.literal_eval(raw)
-                    batch_num = job.get('batch_num')
-                    stored_filename = job.get('stored_filename')
-                    print(f"Processing job: batch_num={batch_num}, file={stored_filename}")
-                    process_batch(batch_num, stored_filename)
+                    with metrics.timer('etl_job'), work_queue.heartbeat(r, ETL_QUEUE, [payload]):
+                        handle_job(parse_job(raw))
                 except Exception as job_error:
+                    metrics.increment('etl_job_errors')
                     print(f'Error processing job {raw}: {job_error}')
                     import traceback
                     traceback.print_exc()
+                work_queue.ack(r, ETL_QUEUE, payload)
+            metrics.push(r, 'etl_worker')
         except KeyboardInterrupt:
             print("ETL worker shutting down...")
             break
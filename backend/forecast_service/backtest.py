@@ -0,0 +1,181 @@
+"""Rolling-origin backtests of the forecast models, stored per category in model_backtest.
+
+    python forecast_service/backtest.py [--categories A,B] [--models prophet,sarimax] [--folds 4]
+
+Every category's daily history is cut at BACKTEST_FOLDS origins. Each model
+is fitted on the days before an origin with the same functions the forecast
+worker uses, and scored on the following horizon days. Fits run in a process
+pool across all (category, model, fold) triples. Origins sit on a fixed
+calendar grid every BACKTEST_STEP days, so once more data arrives the older
+folds keep the same training window. Their fitted forecasts come from the
+fold cache under BACKTEST_CACHE_DIR, keyed by model, horizon and a hash of
+the training series.
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import argparse
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from common.db import engine
+from forecast_service.forecast_worker import MODELS, load_histories, run_model, series_fingerprint
+
+# Evaluation origins per category, the most recent ones whose horizon is fully observed
+BACKTEST_FOLDS = int(os.getenv('BACKTEST_FOLDS', '4'))
+# Days forecast and scored after each origin
+BACKTEST_HORIZON = int(os.getenv('BACKTEST_HORIZON', '14'))
+# Days between origins
+BACKTEST_STEP = int(os.getenv('BACKTEST_STEP', str(BACKTEST_HORIZON)))
+# Folds with fewer training days than this are skipped
+BACKTEST_MIN_TRAIN = int(os.getenv('BACKTEST_MIN_TRAIN', '56'))
+BACKTEST_WORKERS = int(os.getenv('BACKTEST_WORKERS', '0')) or os.cpu_count() or 1
+# Fitted fold forecasts, reused while the training window is unchanged
+BACKTEST_CACHE_DIR = os.getenv('BACKTEST_CACHE_DIR', '/app/data/backtest_cache')
+
+CATEGORIES_SQL = text('SELECT DISTINCT category FROM daily_category_sales')
+
+BACKTEST_UPSERT_SQL = text('''
+INSERT INTO model_backtest (category, model_type, folds, failed_folds, horizon, mape, rmse, fit_seconds, evaluated_at)
+VALUES (:category, :model_type, :folds, :failed_folds, :horizon, :mape, :rmse, :fit_seconds, NOW())
+ON DUPLICATE KEY UPDATE
+  folds = VALUES(folds),
+  failed_folds = VALUES(failed_folds),
+  horizon = VALUES(horizon),
+  mape = VALUES(mape),
+  rmse = VALUES(rmse),
+  fit_seconds = VALUES(fit_seconds),
+  evaluated_at = NOW()
+''')
+
+def fold_origins(df, folds, horizon, step):
+    """Row positions of up to `folds` origins on the calendar grid, newest last.
+
+    An origin is the first forecast day of a fold; it needs BACKTEST_MIN_TRAIN
+    days before it and `horizon` observed days from it on.
+    """
+    days = df.index.values.astype('datetime64[D]').astype(np.int64)
+    on_grid = np.flatnonzero(days % step == 0)
+    usable = on_grid[(on_grid >= BACKTEST_MIN_TRAIN) & (on_grid + horizon <= len(df))]
+    return [int(origin) for origin in usable[-folds:]]
+
+def cache_path(model_type, horizon, train):
+    key = hashlib.sha256(f'{model_type}:{horizon}:{series_fingerprint(train)}'.encode('utf-8')).hexdigest()
+    return os.path.join(BACKTEST_CACHE_DIR, model_type, f'{key}.pkl')
+
+def run_fold(model_type, train, horizon, path):
+    """Fit one fold in a pool process, or load it from the fold cache.
+
+    Returns (forecast values or None, fit seconds, cached). Failed fits are
+    cached too, so a model that cannot fit a window is not retried on every run.
+    """
+    if path and os.path.exists(path):
+        values, fit_seconds = pd.read_pickle(path)
+        return values, fit_seconds, True
+    result = run_model(model_type, train, horizon)
+    values = None if result is None else result['forecast'].to_numpy(dtype=float)
+    fit_seconds = None if result is None else result.attrs['fit_seconds']
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        pd.to_pickle((values, fit_seconds), tmp)
+        os.replace(tmp, path)
+    return values, fit_seconds, False
+
+def scores(forecast, actual):
+    """MAPE over days with non-zero sales, and RMSE over all days"""
+    errors = forecast - actual
+    nonzero = actual != 0
+    mape = float(np.mean(np.abs(errors[nonzero]) / actual[nonzero])) if nonzero.any() else None
+    return mape, float(np.sqrt(np.mean(errors ** 2)))
+
+def summarize(cat, model_type, folds, horizon):
+    """model_backtest row from the (forecast, actual, fit seconds) of each fold, None entries being failures"""
+    fitted = [fold for fold in folds if fold[0] is not None]
+    fold_scores = [scores(forecast, actual) for forecast, actual, _ in fitted]
+    mapes = [mape for mape, _ in fold_scores if mape is not None]
+    return {
+        'category': cat,
+        'model_type': model_type,
+        'folds': len(folds),
+        'failed_folds': len(folds) - len(fitted),
+        'horizon': horizon,
+        'mape': float(np.mean(mapes)) if mapes else None,
+        'rmse': float(np.mean([rmse for _, rmse in fold_scores])) if fold_scores else None,
+        'fit_seconds': float(np.mean([seconds for _, _, seconds in fitted])) if fitted else None,
+    }
+
+def backtest(histories, models, folds=BACKTEST_FOLDS, horizon=BACKTEST_HORIZON, step=BACKTEST_STEP,
+             workers=BACKTEST_WORKERS, use_cache=True):
+    """Evaluate `models` on every category of `histories`; returns one summary dict per (category, model)"""
+    outcomes = {}
+    cached = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for cat, df in histories.items():
+            for origin in fold_origins(df, folds, horizon, step):
+                train = df.iloc[:origin]
+                actual = df['sales'].to_numpy(dtype=float)[origin:origin + horizon]
+                for model_type in models:
+                    outcomes.setdefault((cat, model_type), [])
+                    path = cache_path(model_type, horizon, train) if use_cache else None
+                    futures[pool.submit(run_fold, model_type, train, horizon, path)] = (cat, model_type, actual)
+
+        for future in as_completed(futures):
+            cat, model_type, actual = futures[future]
+            try:
+                values, fit_seconds, hit = future.result()
+            except Exception as e:
+                print(f"{model_type} backtest fold failed for category {cat}: {e}")
+                values, fit_seconds, hit = None, None, False
+            cached += hit
+            outcomes[(cat, model_type)].append((values, actual, fit_seconds))
+
+    print(f"Backtested {len(futures)} folds, {cached} from cache")
+    return [summarize(cat, model_type, fold_results, horizon) for (cat, model_type), fold_results in outcomes.items()]
+
+def save_backtests(rows):
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(BACKTEST_UPSERT_SQL, rows)
+
+def report(rows):
+    """Print mean MAPE, RMSE and fit time per model, and how many categories each model wins on MAPE"""
+    df = pd.DataFrame(rows)
+    if df.empty:
+        print('No categories had enough history to backtest')
+        return
+    wins = df.dropna(subset=['mape']).sort_values('mape').drop_duplicates('category')['model_type'].value_counts()
+    summary = df.groupby('model_type')[['mape', 'rmse', 'fit_seconds']].mean()
+    summary['best_for_categories'] = wins.reindex(summary.index).fillna(0).astype(int)
+    print(summary.round(4).to_string())
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--categories', help='comma-separated categories; all by default')
+    parser.add_argument('--models', default=','.join(MODELS), help='comma-separated models to evaluate')
+    parser.add_argument('--folds', type=int, default=BACKTEST_FOLDS)
+    parser.add_argument('--horizon', type=int, default=BACKTEST_HORIZON)
+    parser.add_argument('--step', type=int, default=BACKTEST_STEP)
+    parser.add_argument('--workers', type=int, default=BACKTEST_WORKERS)
+    parser.add_argument('--no-cache', action='store_true', help='refit every fold and leave the fold cache alone')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    models = [m for m in args.models.split(',') if m in MODELS]
+    if args.categories:
+        categories = args.categories.split(',')
+    else:
+        with engine.connect() as conn:
+            categories = [row[0] for row in conn.execute(CATEGORIES_SQL)]
+
+    start = time.perf_counter()
+    rows = backtest(load_histories(categories), models, folds=args.folds, horizon=args.horizon, step=args.step,
+                    workers=args.workers, use_cache=not args.no_cache)
+    save_backtests(rows)
+    print(f"Stored {len(rows)} backtest results in {time.perf_counter() - start:.1f}s")
+    report(rows)
@@ -2,20 +2,73 @@ import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import time
-from datetime import timedelta
+# Reference point for the cold-start metrics, taken before the heavier imports below
+STARTED_AT = time.perf_counter()
+import hashlib
+import json
+import socket
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
 import redis
 import pandas as pd
 import numpy as np
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+from common import metrics, work_queue
+from common.cache import bump_versions
 from common.db import engine, SessionLocal
-from prophet import Prophet
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from statsmodels.tsa.statespace.sarimax import SARIMAX
+from forecast_service import hierarchy, hw_batch
 import warnings
 warnings.filterwarnings('ignore')
 
 REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 HORIZON = int(os.getenv('FORECAST_HORIZON_DAYS', '30'))
+# Number of processes used to fit (category, model) pairs in parallel; 0 means one per CPU core
+FORECAST_WORKERS = int(os.getenv('FORECAST_WORKERS', '1')) or os.cpu_count() or 1
+# Keep one pool of FORECAST_WORKERS processes for the worker's lifetime, each warmed up at startup
+# (model imports and a tiny Prophet fit), instead of forking a cold pool for every work unit
+WARM_POOL = os.getenv('FORECAST_WARM_POOL', 'false').lower() == 'true'
+# Categories whose daily history is fetched per aggregate query
+HISTORY_CHUNK_SIZE = int(os.getenv('FORECAST_HISTORY_CHUNK_SIZE', '500'))
+# Reuse persisted SARIMAX/Holt-Winters parameters between batches instead of refitting from scratch
+WARM_START = os.getenv('FORECAST_WARM_START', 'true').lower() == 'true'
+# Days after which a model is refitted from scratch even if its parameters still look fine
+FULL_REFIT_DAYS = int(os.getenv('FORECAST_FULL_REFIT_DAYS', '7'))
+# A model is refitted from scratch when the RMSE on newly appended days exceeds this multiple of its residual std
+DRIFT_TOLERANCE = float(os.getenv('FORECAST_DRIFT_TOLERANCE', '3.0'))
+WARM_MAXITER = int(os.getenv('FORECAST_WARM_MAXITER', '50'))
+# Skip categories whose daily series is identical to the one behind their last saved forecast
+SKIP_UNCHANGED = os.getenv('FORECAST_SKIP_UNCHANGED', 'true').lower() == 'true'
+BATCH_REPORT_TTL = int(os.getenv('FORECAST_BATCH_REPORT_TTL', str(7 * 24 * 3600)))
+# Batches pushed by the ETL are split into work items of up to ITEM_CATEGORIES categories that any
+# worker replica can take. One item is one history query chunk, so its reads, writes, pool fan-out
+# and batched Holt-Winters fit cover as many categories as before the split.
+BATCH_QUEUE = 'forecast_queue'
+ITEM_QUEUE = 'forecast_items'
+ITEM_CATEGORIES = int(os.getenv('FORECAST_ITEM_CATEGORIES', str(HISTORY_CHUNK_SIZE)))
+RECLAIM_INTERVAL = int(os.getenv('FORECAST_RECLAIM_INTERVAL', '60'))
+# Cheap models run for every category; heavy ones only for categories whose sales over the last
+# VOLUME_WINDOW_DAYS reach HEAVY_MIN_VOLUME (0 gives every category every model), or that were
+# read through the API within HOT_TTL seconds
+CHEAP_MODELS = ('holt_winters', 'seasonal_naive')
+HEAVY_MODELS = ('prophet', 'sarimax')
+HEAVY_MIN_VOLUME = float(os.getenv('FORECAST_HEAVY_MIN_VOLUME', '0'))
+VOLUME_WINDOW_DAYS = int(os.getenv('FORECAST_VOLUME_WINDOW_DAYS', '28'))
+HOT_TTL = int(os.getenv('FORECAST_HOT_TTL', str(7 * 24 * 3600)))
+HOT_SET = 'forecast_hot'
+# On-demand heavy fits requested by the API; served before any batch work
+PRIORITY_QUEUE = 'forecast_priority'
+# 'statsmodels' fits Holt-Winters per category (warm-started); 'batched' fits all categories of a
+# work unit at once with the vectorized engine in hw_batch.py
+HW_ENGINE = os.getenv('FORECAST_HW_ENGINE', 'statsmodels')
+# Also forecast every product of each forecast category, reconciled with the category forecast
+PRODUCT_FORECASTS = os.getenv('FORECAST_PRODUCT_LEVEL', 'false').lower() == 'true'
+# 'mint' or 'bottom_up'; see hierarchy.py
+RECONCILIATION = os.getenv('FORECAST_RECONCILIATION', 'mint')
+# Category model whose forecast the products are reconciled with
+PRODUCT_TOP_MODEL = os.getenv('FORECAST_PRODUCT_TOP_MODEL', 'holt_winters')
+# Days of product history fitted, counted back from each category's last day
+PRODUCT_HISTORY_DAYS = int(os.getenv('FORECAST_PRODUCT_HISTORY_DAYS', '365'))
 
 # Wait for services to be ready
 def wait_for_services():
@@ -36,14 +89,15 @@ def wait_for_services():
             time.sleep(2)
     raise Exception("Services not available after retries")
 
-wait_for_services()
-
 r = redis.from_url(REDIS_URL)
 DB = SessionLocal()
 
 def forecast_prophet(df, horizon):
     """Generate forecast using FB Prophet"""
     try:
+        # Model libraries are imported on first use so the worker starts without paying for them
+        from prophet import Prophet
+
         # Prepare data for Prophet
         prophet_df = df.reset_index().rename(columns={'date': 'ds', 'sales': 'y'})
         
@@ -82,9 +136,50 @@ def forecast_prophet(df, horizon):
         print(f"Prophet forecast error: {e}")
         return None
 
-def forecast_sarimax(df, horizon):
-    """Generate forecast using SARIMAX"""
+def refit_mode(df, state):
+    """Decide how a model with persisted state is fitted on this history.
+
+    'full'   - no state, or the scheduled full refit is due
+    'update' - days were only appended: keep the parameters and re-run the filter
+    'warm'   - history was revised: re-optimize starting from the stored parameters
+    """
+    if state is None:
+        return 'full'
+    if datetime.utcnow() - datetime.fromisoformat(state['full_fit_at']) > timedelta(days=FULL_REFIT_DAYS):
+        return 'full'
+    nobs = state['nobs']
+    if len(df) > nobs and df.index[nobs - 1] == pd.Timestamp(state['last_date']):
+        return 'update'
+    return 'warm'
+
+def within_drift(residuals, state):
+    """Check that one-step errors on newly appended days are in line with the stored residual std"""
+    residuals = np.asarray(residuals, dtype=float)
+    if len(residuals) == 0 or not state['residual_std']:
+        return True
+    rmse = float(np.sqrt(np.mean(residuals ** 2)))
+    return rmse <= DRIFT_TOLERANCE * state['residual_std']
+
+def new_state(df, params, residual_std, mode, state):
+    """Build the persisted state of a freshly fitted model"""
+    full_fit_at = datetime.utcnow().isoformat() if mode == 'full' else state['full_fit_at']
+    return {
+        'params': params,
+        'nobs': len(df),
+        'last_date': df.index.max().date().isoformat(),
+        'residual_std': float(residual_std),
+        'full_fit_at': full_fit_at,
+    }
+
+def forecast_sarimax(df, horizon, state=None):
+    """Generate forecast using SARIMAX.
+
+    With a persisted `state` the fit is warm-started (see refit_mode); the new
+    state is returned in `result.attrs['model_state']`.
+    """
     try:
+        from statsmodels.tsa.statespace.sarimax import SARIMAX
+
         # Ensure we have enough data (need at least 2 weeks for weekly seasonality)
         if len(df) < 21:
             return None
@@ -100,7 +195,19 @@ def forecast_sarimax(df, horizon):
             enforce_invertibility=False
         )
         
-        fitted_model = model.fit(disp=False, maxiter=200, method='lbfgs')
+        mode = refit_mode(df, state)
+        fitted_model = None
+        if mode == 'update':
+            # Kalman filter over the extended series with the stored parameters, no optimization
+            fitted_model = model.filter(np.asarray(state['params']))
+            if not within_drift(fitted_model.resid[state['nobs']:], state):
+                print("SARIMAX drift detected, refitting from scratch")
+                mode = 'full'
+                fitted_model = None
+        elif mode == 'warm':
+            fitted_model = model.fit(start_params=np.asarray(state['params']), disp=False, maxiter=WARM_MAXITER, method='lbfgs')
+        if fitted_model is None:
+            fitted_model = model.fit(disp=False, maxiter=200, method='lbfgs')
         
         # Generate forecast
         forecast_result = fitted_model.get_forecast(steps=horizon)
@@ -122,29 +229,74 @@ def forecast_sarimax(df, horizon):
         result['forecast'] = result['forecast'].clip(lower=0)
         result['lower'] = result['lower'].clip(lower=0)
         result['upper'] = result['upper'].clip(lower=0)
+
+        # Skip the first 8 residuals, which absorb the regular and seasonal differencing
+        residual_std = np.std(np.asarray(fitted_model.resid)[8:])
+        result.attrs['model_state'] = new_state(df, [float(p) for p in fitted_model.params], residual_std, mode, state)
         
         return result
     except Exception as e:
         print(f"SARIMAX forecast error: {e}")
         return None
 
-def forecast_holt_winters(df, horizon):
-    """Generate forecast using Holt-Winters Exponential Smoothing"""
+def forecast_holt_winters(df, horizon, state=None):
+    """Generate forecast using Holt-Winters Exponential Smoothing.
+
+    With a persisted `state` the fit is warm-started (see refit_mode); the new
+    state is returned in `result.attrs['model_state']`.
+    """
     try:
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
         # Ensure we have enough data (need at least 2 seasonal periods)
         if len(df) < 21:
             return None
         
-        # Fit Holt-Winters model
-        model = ExponentialSmoothing(
-            df['sales'],
-            seasonal_periods=7,
-            trend='add',
-            seasonal='add',
-            initialization_method='estimated'
-        )
-        
-        fitted_model = model.fit(optimized=True)
+        mode = refit_mode(df, state)
+        fitted_model = None
+        if mode == 'update':
+            # Re-run the smoothing recursions with the stored parameters, no optimization
+            params = state['params']
+            model = ExponentialSmoothing(
+                df['sales'],
+                seasonal_periods=7,
+                trend='add',
+                seasonal='add',
+                initialization_method='known',
+                initial_level=params['initial_level'],
+                initial_trend=params['initial_trend'],
+                initial_seasonal=params['initial_seasons']
+            )
+            fitted_model = model.fit(
+                smoothing_level=params['smoothing_level'],
+                smoothing_trend=params['smoothing_trend'],
+                smoothing_seasonal=params['smoothing_seasonal'],
+                optimized=False
+            )
+            if not within_drift(fitted_model.resid[state['nobs']:], state):
+                print("Holt-Winters drift detected, refitting from scratch")
+                mode = 'full'
+                fitted_model = None
+
+        if fitted_model is None:
+            # Fit Holt-Winters model
+            model = ExponentialSmoothing(
+                df['sales'],
+                seasonal_periods=7,
+                trend='add',
+                seasonal='add',
+                initialization_method='estimated'
+            )
+            if mode == 'warm':
+                # statsmodels orders free parameters as alpha, beta, gamma, l0, b0, s0..s6
+                params = state['params']
+                start_params = [
+                    params['smoothing_level'], params['smoothing_trend'], params['smoothing_seasonal'],
+                    params['initial_level'], params['initial_trend'], *params['initial_seasons']
+                ]
+                fitted_model = model.fit(optimized=True, start_params=start_params, use_brute=False)
+            else:
+                fitted_model = model.fit(optimized=True)
         
         # Generate forecast with simulation for better confidence intervals
         forecast_result = fitted_model.forecast(steps=horizon)
@@ -173,122 +325,714 @@ def forecast_holt_winters(df, horizon):
         result['forecast'] = result['forecast'].clip(lower=0)
         result['lower'] = result['lower'].clip(lower=0)
         result['upper'] = result['upper'].clip(lower=0)
+
+        fitted_params = fitted_model.params
+        params = {
+            'smoothing_level': float(fitted_params['smoothing_level']),
+            'smoothing_trend': float(fitted_params['smoothing_trend']),
+            'smoothing_seasonal': float(fitted_params['smoothing_seasonal']),
+            'initial_level': float(fitted_params['initial_level']),
+            'initial_trend': float(fitted_params['initial_trend']),
+            'initial_seasons': [float(v) for v in fitted_params['initial_seasons']],
+        }
+        result.attrs['model_state'] = new_state(df, params, std_error, mode, state)
         
         return result
     except Exception as e:
         print(f"Holt-Winters forecast error: {e}")
         return None
 
-def process_batch(batch_num):
-    # Find distinct categories updated in this batch
-    res = DB.execute(text('SELECT DISTINCT category FROM invoice_data WHERE batch_num = :batch'), {'batch': batch_num})
-    categories = [row[0] for row in res]
-    print(f"Forecasting for batch {batch_num}, categories: {categories}")
+def forecast_seasonal_naive(df, horizon):
+    """Repeat the last observed week; a near-free baseline for categories nobody reads closely"""
+    try:
+        sales = df['sales']
+        steps = np.arange(horizon)
+        forecast = sales.values[-7:][steps % 7]
+
+        # Intervals from the errors of the same rule on history, widening with each week ahead
+        errors = (sales - sales.shift(7)).dropna()
+        std_error = np.std(errors) if len(errors) else 0.0
+        margins = 1.96 * std_error * np.sqrt(steps // 7 + 1)
+
+        last_date = df.index.max()
+        return pd.DataFrame({
+            'date': pd.date_range(start=last_date + timedelta(days=1), periods=horizon, freq='D'),
+            'forecast': forecast,
+            'lower': np.clip(forecast - margins, 0, None),
+            'upper': np.clip(forecast + margins, 0, None)
+        })
+    except Exception as e:
+        print(f"Seasonal naive forecast error: {e}")
+        return None
+
+MODELS = {
+    'prophet': forecast_prophet,
+    'sarimax': forecast_sarimax,
+    'holt_winters': forecast_holt_winters,
+    'seasonal_naive': forecast_seasonal_naive,
+}
+
+# Models whose fitted parameters are persisted in model_state and reused by later batches
+WARM_STARTED = {'sarimax', 'holt_winters'}
+
+def run_model(model_type, df, horizon, state=None):
+    """Fit one model for one category; runs inside a pool process when FORECAST_WORKERS > 1.
+
+    The fit time travels back in the result's attrs, since metrics recorded in
+    a pool process would never reach this worker's registry.
+    """
+    start = time.perf_counter()
+    if model_type in WARM_STARTED:
+        result = MODELS[model_type](df, horizon, state=state)
+    else:
+        result = MODELS[model_type](df, horizon)
+    if result is not None:
+        result.attrs['fit_seconds'] = time.perf_counter() - start
+    return result
 
+def record_fit(model_type, result):
+    """Record the fit time of a run_model result, or a failure when it produced nothing"""
+    if result is None:
+        metrics.increment('forecast_fit_failures', model=model_type)
+    else:
+        metrics.observe('forecast_fit', result.attrs.pop('fit_seconds', 0.0), model=model_type)
+
+STATE_SQL = text(
+    'SELECT category, model_type, params, nobs, last_date, residual_std, full_fit_at FROM model_state '
+    'WHERE category IN :cats'
+).bindparams(bindparam('cats', expanding=True))
+
+def load_model_states(categories):
+    """Load persisted model parameters keyed by (category, model_type)"""
+    states = {}
+    if not WARM_START:
+        return states
+    for start in range(0, len(categories), HISTORY_CHUNK_SIZE):
+        chunk = categories[start:start + HISTORY_CHUNK_SIZE]
+        with engine.connect() as conn:
+            for row in conn.execute(STATE_SQL, {'cats': chunk}):
+                states[(row.category, row.model_type)] = {
+                    'params': json.loads(row.params),
+                    'nobs': row.nobs,
+                    'last_date': row.last_date.isoformat(),
+                    'residual_std': row.residual_std,
+                    'full_fit_at': row.full_fit_at.isoformat(),
+                }
+    return states
+
+HISTORY_SQL = text(
+    'SELECT category, `date`, sales FROM daily_category_sales '
+    'WHERE category IN :cats ORDER BY category, `date`'
+).bindparams(bindparam('cats', expanding=True))
+
+def load_histories(categories):
+    """Load the daily sales series of many categories from the daily_category_sales rollup,
+    one query per HISTORY_CHUNK_SIZE categories.
+
+    Categories with fewer than 7 days of data are left out of the result.
+    """
+    frames = {}
+    for start in range(0, len(categories), HISTORY_CHUNK_SIZE):
+        chunk = categories[start:start + HISTORY_CHUNK_SIZE]
+        rows = pd.read_sql(HISTORY_SQL, engine, params={'cats': chunk})
+        rows['date'] = pd.to_datetime(rows['date'])
+        rows['sales'] = rows['sales'].astype(float)
+        for cat, group in rows.groupby('category', sort=False):
+            frames[cat] = group[['date', 'sales']].set_index('date')
+
+    histories = {}
     for cat in categories:
-        # Use separate connection for read
-        df = pd.read_sql(
-            text('SELECT `date`, SUM(sales) as sales FROM invoice_data WHERE category = :cat GROUP BY `date` ORDER BY `date`'),
-            engine,
-            params={'cat': cat}
-        )
-        if df.empty or len(df) < 7:
+        df = frames.get(cat)
+        if df is None or len(df) < 7:
             print(f"Skipping category {cat}: insufficient data (need at least 7 days)")
             continue
-            
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.set_index('date')
-        
         # Ensure sales are non-negative before forecasting
         df['sales'] = df['sales'].clip(lower=0)
+        histories[cat] = df
+    return histories
 
-        # Generate forecasts for each model
-        forecasts = []
-        
-        # Prophet forecast
-        prophet_result = forecast_prophet(df, HORIZON)
-        if prophet_result is not None:
-            for _, row in prophet_result.iterrows():
-                forecasts.append({
-                    'forecast_date': row['date'].date(),
-                    'category': cat,
-                    'model_type': 'prophet',
-                    'forecast_value': round(float(row['forecast']), 2),
-                    'lower_bound': round(float(row['lower']), 2),
-                    'upper_bound': round(float(row['upper']), 2)
-                })
-        
-        # SARIMAX forecast
-        sarimax_result = forecast_sarimax(df, HORIZON)
-        if sarimax_result is not None:
-            for _, row in sarimax_result.iterrows():
-                forecasts.append({
-                    'forecast_date': row['date'].date(),
-                    'category': cat,
-                    'model_type': 'sarimax',
-                    'forecast_value': round(float(row['forecast']), 2),
-                    'lower_bound': round(float(row['lower']), 2),
-                    'upper_bound': round(float(row['upper']), 2)
-                })
-        
-        # Holt-Winters forecast
-        hw_result = forecast_holt_winters(df, HORIZON)
-        if hw_result is not None:
-            for _, row in hw_result.iterrows():
-                forecasts.append({
-                    'forecast_date': row['date'].date(),
-                    'category': cat,
-                    'model_type': 'holt_winters',
-                    'forecast_value': round(float(row['forecast']), 2),
-                    'lower_bound': round(float(row['lower']), 2),
-                    'upper_bound': round(float(row['upper']), 2)
-                })
-
-        if not forecasts:
-            print(f"No forecasts generated for category {cat}")
+FINGERPRINT_SQL = text(
+    'SELECT category, fingerprint FROM forecast_fingerprint WHERE category IN :cats'
+).bindparams(bindparam('cats', expanding=True))
+
+FINGERPRINT_UPSERT_SQL = text('''
+INSERT INTO forecast_fingerprint (category, fingerprint, batch_num)
+VALUES (:category, :fingerprint, :batch_num)
+ON DUPLICATE KEY UPDATE
+  fingerprint = VALUES(fingerprint),
+  batch_num = VALUES(batch_num),
+  updated_at = NOW()
+''')
+
+def series_fingerprint(df):
+    """Content hash of a daily series (dates and sales in cents) plus the forecast horizon"""
+    days = df.index.values.astype('datetime64[D]').astype(np.int64)
+    cents = np.round(df['sales'].to_numpy(dtype=float) * 100).astype(np.int64)
+    digest = hashlib.sha256(str(HORIZON).encode('utf-8'))
+    digest.update(days.tobytes())
+    digest.update(cents.tobytes())
+    return digest.hexdigest()
+
+# Order-independent checksum of a category's product rows. With product forecasts on it is folded into
+# the category fingerprint, so a changed product mix behind unchanged category totals is still refit.
+PRODUCT_CHECKSUM_SQL = text(
+    "SELECT category, COUNT(*) AS n, SUM(CRC32(CONCAT_WS('|', product_id, `date`, ROUND(sales * 100)))) AS checksum "
+    'FROM invoice_data WHERE category IN :cats GROUP BY category'
+).bindparams(bindparam('cats', expanding=True))
+
+FINGERPRINT_DELETE_SQL = text(
+    'DELETE FROM forecast_fingerprint WHERE category IN :cats'
+).bindparams(bindparam('cats', expanding=True))
+
+def product_checksums(categories):
+    """{category: 'rows:checksum'} of the product rows of each category, one query per HISTORY_CHUNK_SIZE categories"""
+    checksums = {}
+    for start in range(0, len(categories), HISTORY_CHUNK_SIZE):
+        chunk = categories[start:start + HISTORY_CHUNK_SIZE]
+        with engine.connect() as conn:
+            for row in conn.execute(PRODUCT_CHECKSUM_SQL, {'cats': chunk}):
+                checksums[row.category] = f'{row.n}:{row.checksum}'
+    return checksums
+
+def with_product_mix(fingerprints):
+    """Fold the product checksum of each category into its series fingerprint"""
+    checksums = product_checksums(list(fingerprints))
+    return {
+        cat: hashlib.sha256(f'{fingerprint}:{checksums.get(cat)}'.encode('utf-8')).hexdigest()
+        for cat, fingerprint in fingerprints.items()
+    }
+
+def forget_fingerprints(categories):
+    """Drop stored fingerprints so the next batch refits these categories"""
+    if categories:
+        with engine.begin() as conn:
+            conn.execute(FINGERPRINT_DELETE_SQL, {'cats': categories})
+
+def load_fingerprints(categories):
+    """Load the fingerprints of the series behind each category's last saved forecast"""
+    fingerprints = {}
+    for start in range(0, len(categories), HISTORY_CHUNK_SIZE):
+        chunk = categories[start:start + HISTORY_CHUNK_SIZE]
+        with engine.connect() as conn:
+            for row in conn.execute(FINGERPRINT_SQL, {'cats': chunk}):
+                fingerprints[row.category] = row.fingerprint
+    return fingerprints
+
+FORECAST_UPSERT_SQL = text('''
+INSERT INTO forecast_data (forecast_date, category, model_type, forecast_value, lower_bound, upper_bound, batch_num)
+VALUES (:forecast_date, :category, :model_type, :forecast_value, :lower_bound, :upper_bound, :batch_num)
+ON DUPLICATE KEY UPDATE
+  forecast_value = VALUES(forecast_value),
+  lower_bound = VALUES(lower_bound),
+  upper_bound = VALUES(upper_bound),
+  batch_num = VALUES(batch_num),
+  created_at = NOW()
+''')
+
+def forecast_rows(batch_num, cat, results):
+    """Stack the result frames of all models into forecast_data parameter dicts with column operations"""
+    frames = []
+    for model_type, result in results.items():
+        if result is None or result.empty:
             continue
+        frames.append(pd.DataFrame({
+            'forecast_date': pd.to_datetime(result['date']).dt.date.values,
+            'model_type': model_type,
+            'forecast_value': result['forecast'].astype(float).round(2).values,
+            'lower_bound': result['lower'].astype(float).round(2).values,
+            'upper_bound': result['upper'].astype(float).round(2).values,
+        }))
+    if not frames:
+        return []
+    rows = pd.concat(frames, ignore_index=True)
+    rows['category'] = cat
+    rows['batch_num'] = batch_num
+    return rows.to_dict('records')
 
-        # upsert forecasts with new connection and transaction
-        conn = engine.connect()
-        trans = conn.begin()
-        try:
-            for f in forecasts:
-                sql = text('''
-                INSERT INTO forecast_data (forecast_date, category, model_type, forecast_value, lower_bound, upper_bound, batch_num)
-                VALUES (:forecast_date, :category, :model_type, :forecast_value, :lower_bound, :upper_bound, :batch_num)
-                ON DUPLICATE KEY UPDATE
-                  forecast_value = VALUES(forecast_value),
-                  lower_bound = VALUES(lower_bound),
-                  upper_bound = VALUES(upper_bound),
-                  batch_num = VALUES(batch_num),
-                  created_at = NOW()
-                ''')
-                conn.execute(sql, {
-                    'forecast_date': f['forecast_date'],
-                    'category': f['category'],
-                    'model_type': f['model_type'],
-                    'forecast_value': f['forecast_value'],
-                    'lower_bound': f['lower_bound'],
-                    'upper_bound': f['upper_bound'],
-                    'batch_num': batch_num
-                })
+MODEL_STATE_UPSERT_SQL = text('''
+INSERT INTO model_state (category, model_type, params, nobs, last_date, residual_std, full_fit_at)
+VALUES (:category, :model_type, :params, :nobs, :last_date, :residual_std, :full_fit_at)
+ON DUPLICATE KEY UPDATE
+  params = VALUES(params),
+  nobs = VALUES(nobs),
+  last_date = VALUES(last_date),
+  residual_std = VALUES(residual_std),
+  full_fit_at = VALUES(full_fit_at)
+''')
+
+def model_state_rows(cat, results):
+    """Collect the model_state parameter dicts returned by warm-started models"""
+    rows = []
+    for model_type, result in results.items():
+        if result is None or 'model_state' not in result.attrs:
+            continue
+        state = result.attrs['model_state']
+        rows.append({
+            'category': cat,
+            'model_type': model_type,
+            'params': json.dumps(state['params']),
+            'nobs': state['nobs'],
+            'last_date': state['last_date'],
+            'residual_std': state['residual_std'],
+            'full_fit_at': datetime.fromisoformat(state['full_fit_at'])
+        })
+    return rows
+
+def save_forecasts(batch_num, cat, results, fingerprint=None):
+    """Upsert the forecasts of every model that produced a result for a category.
+
+    The series fingerprint is stored in the same transaction, but only when
+    every model in `results` succeeded, so a failed model is retried with the
+    next batch even if the series did not change. Returns True on success.
+    """
+    forecasts = forecast_rows(batch_num, cat, results)
+    if any(result is None for result in results.values()):
+        fingerprint = None
+
+    if not forecasts:
+        print(f"No forecasts generated for category {cat}")
+        return False
+
+    # upsert forecasts with new connection and transaction; one executemany for all rows
+    conn = engine.connect()
+    trans = conn.begin()
+    try:
+        with metrics.timer('forecast_stage', stage='write'):
+            conn.execute(FORECAST_UPSERT_SQL, forecasts)
+            states = model_state_rows(cat, results)
+            if states:
+                conn.execute(MODEL_STATE_UPSERT_SQL, states)
+            if fingerprint is not None:
+                conn.execute(FINGERPRINT_UPSERT_SQL, {'category': cat, 'fingerprint': fingerprint, 'batch_num': batch_num})
             trans.commit()
-            print(f"Forecast saved for category: {cat}, {len(forecasts)} records")
+        bump_versions(r, [f'forecast:{cat}', 'forecast:*'])
+        print(f"Forecast saved for category: {cat}, {len(forecasts)} records")
+        return True
+    except Exception as e:
+        trans.rollback()
+        print('error writing forecasts for', cat, e)
+        return False
+    finally:
+        conn.close()
+
+def hot_categories(categories):
+    """Categories among `categories` that were read through the API within HOT_TTL seconds"""
+    if not categories:
+        return set()
+    cutoff = time.time() - HOT_TTL
+    r.zremrangebyscore(HOT_SET, 0, cutoff)
+    scores = r.zmscore(HOT_SET, categories)
+    return {cat for cat, score in zip(categories, scores) if score is not None and score >= cutoff}
+
+def skipped_key(category):
+    return f'forecast_skipped:{category}'
+
+def record_skipped(models):
+    """Remember the heavy models tiering left out per category; the API fits only those on demand"""
+    pipe = r.pipeline()
+    for cat, selected in models.items():
+        pipe.delete(skipped_key(cat))
+        skipped = [m for m in HEAVY_MODELS if m not in selected]
+        if skipped:
+            pipe.sadd(skipped_key(cat), *skipped)
+    pipe.execute()
+
+def select_models(histories):
+    """Model types to fit per category: cheap models always, heavy ones for high-volume or hot categories"""
+    if HEAVY_MIN_VOLUME <= 0:
+        return {cat: list(MODELS) for cat in histories}
+    hot = hot_categories(list(histories))
+    selected = {}
+    for cat, df in histories.items():
+        recent = df['sales'][df.index > df.index.max() - timedelta(days=VOLUME_WINDOW_DAYS)].sum()
+        heavy = recent >= HEAVY_MIN_VOLUME or cat in hot
+        selected[cat] = list(CHEAP_MODELS) + (list(HEAVY_MODELS) if heavy else [])
+    return selected
+
+def forecast_batched_hw(histories, models):
+    """Fit Holt-Winters for every category that selected it in one vectorized pass.
+
+    Removes 'holt_winters' from `models` and returns {category: {'holt_winters': result}}.
+    Like forecast_holt_winters, series shorter than 21 days get no result.
+    """
+    selected = {cat: df for cat, df in histories.items() if 'holt_winters' in models[cat]}
+    if not selected:
+        return {}
+    eligible = {cat: df for cat, df in selected.items() if len(df) >= 21}
+    start = time.perf_counter()
+    try:
+        fitted = hw_batch.forecast_many(eligible, HORIZON) if eligible else {}
+    except Exception as e:
+        print(f"Batched Holt-Winters error: {e}")
+        fitted = {}
+    per_category = (time.perf_counter() - start) / max(len(eligible), 1)
+    precomputed = {}
+    for cat in selected:
+        models[cat] = [m for m in models[cat] if m != 'holt_winters']
+        result = fitted.get(cat)
+        if result is not None:
+            result.attrs['fit_seconds'] = per_category
+        record_fit('holt_winters', result)
+        precomputed[cat] = {'holt_winters': result}
+    return precomputed
+
+def forecast_sequential(batch_num, histories, states, fingerprints, models, precomputed):
+    """Fit the selected models of every category in this process; returns the set of categories saved"""
+    saved = set()
+    for cat, df in histories.items():
+        results = {model_type: run_model(model_type, df, HORIZON, states.get((cat, model_type))) for model_type in models[cat]}
+        for model_type, result in results.items():
+            record_fit(model_type, result)
+        results.update(precomputed.get(cat, {}))
+        if save_forecasts(batch_num, cat, results, fingerprints.get(cat)):
+            saved.add(cat)
+    return saved
+
+_pool = None
+
+def warm_up():
+    """Pool initializer: load the model libraries and Prophet's Stan backend before the first real fit"""
+    start = time.perf_counter()
+    df = pd.DataFrame({'sales': np.arange(28) % 7 + 1.0}, index=pd.date_range('2000-01-01', periods=28, name='date'))
+    forecast_prophet(df, 1)
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing  # noqa: F401
+    from statsmodels.tsa.statespace.sarimax import SARIMAX  # noqa: F401
+    print(f"Pool process {os.getpid()} warmed up in {time.perf_counter() - start:.1f}s")
+
+def get_pool():
+    """Process pool for model fits: the persistent warm pool with FORECAST_WARM_POOL, otherwise a fresh one"""
+    global _pool
+    if not WARM_POOL:
+        return ProcessPoolExecutor(max_workers=FORECAST_WORKERS)
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=FORECAST_WORKERS, initializer=warm_up)
+        # Start every process now so the warm-up overlaps with waiting for the first job
+        for _ in range(FORECAST_WORKERS):
+            _pool.submit(time.sleep, 0)
+    return _pool
+
+def forecast_parallel(batch_num, histories, states, fingerprints, models, precomputed):
+    """Fan (category, model) fits out over a process pool and save each category as soon as its models finish.
+
+    Returns the set of categories saved.
+    """
+    global _pool
+    saved = set()
+    pending = {cat: dict(precomputed.get(cat, {})) for cat in histories}
+    expected = {cat: len(models[cat]) + len(pending[cat]) for cat in histories}
+    pool = get_pool()
+    try:
+        futures = {}
+        for cat, df in histories.items():
+            if not models[cat]:
+                # Everything was fitted up front
+                if save_forecasts(batch_num, cat, pending.pop(cat), fingerprints.get(cat)):
+                    saved.add(cat)
+                continue
+            for model_type in models[cat]:
+                state = states.get((cat, model_type))
+                futures[pool.submit(run_model, model_type, df, HORIZON, state)] = (cat, model_type)
+
+        for future in as_completed(futures):
+            cat, model_type = futures[future]
+            try:
+                pending[cat][model_type] = future.result()
+            except Exception as e:
+                # A failed fit only loses this (category, model) pair
+                print(f"{model_type} task failed for category {cat}: {e}")
+                pending[cat][model_type] = None
+            record_fit(model_type, pending[cat][model_type])
+            if len(pending[cat]) == expected[cat]:
+                if save_forecasts(batch_num, cat, pending.pop(cat), fingerprints.get(cat)):
+                    saved.add(cat)
+    except BrokenProcessPool:
+        # A pool process died; start a fresh pool for the next work unit
+        _pool = None
+        raise
+    finally:
+        if pool is not _pool:
+            pool.shutdown()
+    return saved
+
+LAST_DATE_SQL = text(
+    'SELECT category, MAX(`date`) AS last_date FROM daily_category_sales '
+    'WHERE category IN :cats GROUP BY category'
+).bindparams(bindparam('cats', expanding=True))
+
+PRODUCT_HISTORY_SQL = text(
+    'SELECT category, product_id, `date`, sales FROM invoice_data '
+    'WHERE category IN :cats AND `date` >= :since'
+).bindparams(bindparam('cats', expanding=True))
+
+TOP_FORECAST_SQL = text(
+    'SELECT category, forecast_date, forecast_value, upper_bound FROM forecast_data '
+    'WHERE category IN :cats AND model_type = :model AND forecast_date > :since '
+    'ORDER BY category, forecast_date'
+).bindparams(bindparam('cats', expanding=True))
+
+PRODUCT_FORECAST_DELETE_SQL = text(
+    'DELETE FROM product_forecast_data WHERE category IN :cats'
+).bindparams(bindparam('cats', expanding=True))
+
+PRODUCT_FORECAST_INSERT_SQL = text('''
+INSERT INTO product_forecast_data
+  (category, product_id, forecast_date, forecast_value, lower_bound, upper_bound, reconciliation, batch_num)
+VALUES (:category, :product_id, :forecast_date, :forecast_value, :lower_bound, :upper_bound, :reconciliation, :batch_num)
+''')
+
+def load_product_histories(categories):
+    """{category: (last_date, rows)} with the last PRODUCT_HISTORY_DAYS days of per-product sales"""
+    with engine.connect() as conn:
+        last_dates = {row.category: pd.Timestamp(row.last_date) for row in conn.execute(LAST_DATE_SQL, {'cats': categories})}
+    if not last_dates:
+        return {}
+    since = (min(last_dates.values()) - timedelta(days=PRODUCT_HISTORY_DAYS)).date()
+    rows = pd.read_sql(PRODUCT_HISTORY_SQL, engine, params={'cats': list(last_dates), 'since': since})
+    rows['date'] = pd.to_datetime(rows['date'])
+    rows['sales'] = rows['sales'].astype(float).clip(lower=0)
+    products = {}
+    for cat, group in rows.groupby('category', sort=False):
+        last_date = last_dates[cat]
+        group = group[group['date'] > last_date - timedelta(days=PRODUCT_HISTORY_DAYS)]
+        products[cat] = (last_date, group[['product_id', 'date', 'sales']])
+    return products
+
+def load_top_forecasts(products):
+    """{category: (forecast values, one-step std)} of PRODUCT_TOP_MODEL for the HORIZON days after each category's history.
+
+    The std comes from the first day's 95% interval. Categories whose stored
+    forecast does not cover the horizon are left out and reconciled bottom-up.
+    """
+    since = min(last_date for last_date, _ in products.values()).date()
+    rows = pd.read_sql(TOP_FORECAST_SQL, engine, params={'cats': list(products), 'model': PRODUCT_TOP_MODEL, 'since': since})
+    rows['forecast_date'] = pd.to_datetime(rows['forecast_date'])
+    tops = {}
+    for cat, group in rows.groupby('category', sort=False):
+        group = group[group['forecast_date'] > products[cat][0]].head(HORIZON)
+        if len(group) < HORIZON or pd.isna(group['upper_bound'].iloc[0]):
+            continue
+        values = group['forecast_value'].to_numpy(dtype=float)
+        tops[cat] = (values, (float(group['upper_bound'].iloc[0]) - values[0]) / 1.96)
+    return tops
+
+def forecast_products(batch_num, categories):
+    """Forecast, reconcile and store the products of freshly forecast categories.
+
+    The sum of the stored products is written to forecast_data as model_type
+    'reconciled' in the same transaction, so both levels served agree.
+    """
+    with metrics.timer('forecast_stage', stage='products'):
+        products = load_product_histories(categories)
+        if not products:
+            return
+        tops = load_top_forecasts(products)
+        forecasts = hierarchy.forecast_products(products, tops, HORIZON, RECONCILIATION)
+        if forecasts.empty:
+            return
+        forecasts['batch_num'] = batch_num
+        totals = hierarchy.category_totals(forecasts)
+        totals['batch_num'] = batch_num
+        rows = forecasts.to_dict('records')
+        with engine.begin() as conn:
+            # Replace whole categories so products that stopped selling lose their old forecasts
+            conn.execute(PRODUCT_FORECAST_DELETE_SQL, {'cats': list(products)})
+            for start in range(0, len(rows), 5000):
+                conn.execute(PRODUCT_FORECAST_INSERT_SQL, rows[start:start + 5000])
+            conn.execute(FORECAST_UPSERT_SQL, totals.to_dict('records'))
+    scopes = [f'product_forecast:{cat}' for cat in products] + [f'forecast:{cat}' for cat in products]
+    bump_versions(r, scopes + ['forecast:*'])
+    print(f"Product forecasts saved for {len(products)} categories, {len(rows)} records ({len(tops)} reconciled with {PRODUCT_TOP_MODEL})")
+
+def batch_categories(batch_num):
+    """Find distinct categories updated in this batch"""
+    res = DB.execute(text('SELECT DISTINCT category FROM invoice_data WHERE batch_num = :batch'), {'batch': batch_num})
+    categories = [row[0] for row in res]
+    DB.commit()
+    return categories
+
+def process_categories(batch_num, categories, only_models=None):
+    """Forecast some categories of a batch.
+
+    Returns {category: outcome} with outcome one of 'forecasted', 'skipped'
+    (series unchanged), 'insufficient' (not enough history) or 'failed'.
+    `only_models` fits just those model types for an on-demand request,
+    bypassing the unchanged-series check and the tiering policy.
+    """
+    with metrics.timer('forecast_stage', stage='load'):
+        histories = load_histories(categories)
+    outcomes = {cat: 'insufficient' for cat in categories if cat not in histories}
+
+    fingerprints = {cat: series_fingerprint(df) for cat, df in histories.items()}
+    if only_models is not None:
+        # A partial refit must not mark the series as fully forecast
+        fingerprints = {}
+    elif SKIP_UNCHANGED:
+        with metrics.timer('forecast_stage', stage='load'):
+            if PRODUCT_FORECASTS and fingerprints:
+                fingerprints = with_product_mix(fingerprints)
+            previous = load_fingerprints(list(histories))
+        skipped = [cat for cat in histories if previous.get(cat) == fingerprints[cat]]
+        for cat in skipped:
+            del histories[cat]
+            outcomes[cat] = 'skipped'
+        if skipped:
+            print(f"Skipping {len(skipped)} unchanged categories: {skipped}")
+
+    with metrics.timer('forecast_stage', stage='load'):
+        states = load_model_states(list(histories))
+
+    if only_models is not None:
+        models = {cat: list(only_models) for cat in histories}
+    else:
+        models = select_models(histories)
+        record_skipped(models)
+
+    precomputed = forecast_batched_hw(histories, models) if HW_ENGINE == 'batched' else {}
+
+    if (FORECAST_WORKERS > 1 or WARM_POOL) and histories:
+        saved = forecast_parallel(batch_num, histories, states, fingerprints, models, precomputed)
+    else:
+        saved = forecast_sequential(batch_num, histories, states, fingerprints, models, precomputed)
+
+    if PRODUCT_FORECASTS and saved and only_models is None:
+        try:
+            forecast_products(batch_num, sorted(saved))
         except Exception as e:
-            trans.rollback()
-            print('error writing forecasts for', cat, e)
-        finally:
-            conn.close()
+            # Category forecasts are already stored; without their fingerprints the next batch
+            # refits these categories and their products even if nothing changed
+            print(f"Product forecast error: {e}")
+            forget_fingerprints(sorted(saved))
+
+    for cat in histories:
+        outcomes[cat] = 'forecasted' if cat in saved else 'failed'
+    for outcome in outcomes.values():
+        metrics.increment('forecast_categories', outcome=outcome)
+    return outcomes
+
+def batch_key(batch_num):
+    return f'forecast_batch:{batch_num}'
+
+def start_batch(batch_num, total):
+    """Initialise the progress hash of a batch"""
+    key = batch_key(batch_num)
+    pipe = r.pipeline()
+    pipe.hset(key, mapping={'categories': total, 'status': 'running' if total else 'completed', 'planned_at': int(time.time())})
+    pipe.hsetnx(key, 'skipped', 0)
+    pipe.hsetnx(key, 'forecasted', 0)
+    pipe.expire(key, BATCH_REPORT_TTL)
+    pipe.execute()
+
+def record_outcomes(batch_num, outcomes):
+    """Count finished categories of a batch and mark the batch completed when all are done.
+
+    Categories are tracked in a set, so an item delivered twice is only counted once.
+    """
+    key = batch_key(batch_num)
+    done_key = f'{key}:done'
+    for cat, outcome in outcomes.items():
+        if r.sadd(done_key, cat):
+            r.hincrby(key, outcome, 1)
+    r.expire(done_key, BATCH_REPORT_TTL)
+    total = int(r.hget(key, 'categories') or 0)
+    if r.scard(done_key) >= total and r.hget(key, 'status') != b'completed':
+        r.hset(key, mapping={'status': 'completed', 'completed_at': int(time.time())})
+        print(f"Forecast batch {batch_num} completed: {r.hgetall(key)}")
+
+def batch_of(payload):
+    """Batch number of a forecast_queue payload; plain batch numbers queued by older ETL versions are still accepted"""
+    try:
+        return json.loads(payload)['batch_num']
+    except (ValueError, TypeError, KeyError):
+        return payload.decode('utf-8')
+
+def plan_batch(batch_num):
+    """Split a batch into forecast_items entries of up to ITEM_CATEGORIES categories"""
+    categories = batch_categories(batch_num)
+    print(f"Planning forecast batch {batch_num}: {len(categories)} categories")
+    start_batch(batch_num, len(categories))
+    work_queue.push(r, ITEM_QUEUE, *(
+        {'batch_num': batch_num, 'categories': categories[start:start + ITEM_CATEGORIES]}
+        for start in range(0, len(categories), ITEM_CATEGORIES)
+    ))
+
+def process_item(payload):
+    """Forecast the categories of a reserved work item, then acknowledge it.
+
+    Items queued by older versions carry a single 'category'.
+    """
+    item = json.loads(payload)
+    batch_num = item['batch_num']
+    categories = item['categories'] if 'categories' in item else [item['category']]
+    print(f"Forecasting batch {batch_num}, {len(categories)} categories")
+    with work_queue.heartbeat(r, ITEM_QUEUE, [payload]):
+        record_outcomes(batch_num, process_categories(batch_num, categories))
+    work_queue.ack(r, ITEM_QUEUE, payload)
+
+def process_priority():
+    """Serve one on-demand request for heavy models queued by the API; returns False when there is none"""
+    payload = work_queue.reserve(r, PRIORITY_QUEUE, timeout=0)
+    if payload is None:
+        return False
+    item = json.loads(payload)
+    models = [m for m in item['models'] if m in MODELS]
+    if not models:
+        # An empty list would run the full batch path (tiering, fingerprint) for a single request
+        print(f"On-demand request for category {item['category']} has no model this worker fits: {item['models']}")
+        work_queue.ack(r, PRIORITY_QUEUE, payload)
+        return True
+    print(f"On-demand forecast for category {item['category']}: {models}")
+    with metrics.timer('forecast_on_demand'), work_queue.heartbeat(r, PRIORITY_QUEUE, [payload]):
+        outcomes = process_categories(None, [item['category']], only_models=models)
+    # Attempted, whether or not the fit succeeded: the API stops reporting these models as
+    # pending and caches again. The next batch that skips them for this category re-arms them.
+    r.srem(skipped_key(item['category']), *models)
+    if outcomes.get(item['category']) != 'forecasted':
+        metrics.increment('forecast_on_demand_failures')
+    work_queue.ack(r, PRIORITY_QUEUE, payload)
+    return True
 
 if __name__ == '__main__':
-    print('Forecast worker started, waiting for jobs...')
+    wait_for_services()
+    if WARM_POOL:
+        get_pool()
+    ready = time.perf_counter() - STARTED_AT
+    metrics.observe('forecast_worker_ready', ready)
+    print(f'Forecast worker {socket.gethostname()}:{os.getpid()} started in {ready:.1f}s, waiting for jobs...')
+    first_job = True
+    last_reclaim = 0
     while True:
         try:
-            item = r.brpop('forecast_queue', timeout=5)
-            if item:
-                batch_num = item[1].decode('utf-8')
-                print(f"Processing forecast job for batch: {batch_num}")
-                process_batch(batch_num)
+            if time.time() - last_reclaim > RECLAIM_INTERVAL:
+                for queue in (PRIORITY_QUEUE, BATCH_QUEUE, ITEM_QUEUE):
+                    reclaimed = work_queue.reclaim(r, queue)
+                    if reclaimed:
+                        print(f"Reclaimed {reclaimed} stale items from {queue}")
+                last_reclaim = time.time()
+
+            # Someone is waiting on the dashboard for these
+            worked = process_priority()
+
+            if not worked:
+                # Planning is cheap, so split any waiting batch before taking category work
+                payload = work_queue.reserve(r, BATCH_QUEUE, timeout=0)
+                if payload:
+                    with work_queue.heartbeat(r, BATCH_QUEUE, [payload]):
+                        plan_batch(batch_of(payload))
+                    work_queue.ack(r, BATCH_QUEUE, payload)
+                    continue
+
+                payload = work_queue.reserve(r, ITEM_QUEUE, timeout=5)
+                if payload:
+                    with metrics.timer('forecast_items'):
+                        process_item(payload)
+                    worked = True
+
+            if worked and first_job:
+                first_job = False
+                elapsed = time.perf_counter() - STARTED_AT
+                metrics.observe('forecast_worker_first_job', elapsed)
+                print(f"First forecast job finished {elapsed:.1f}s after start")
+            metrics.push(r, 'forecast_worker')
         except KeyboardInterrupt:
             print("Forecast worker shutting down...")
             break
@@ -0,0 +1,161 @@
+"""Additive Holt-Winters (weekly seasonality) fitted for many series at once.
+
+The series are right-aligned into one (series, time) matrix and the smoothing
+recursions run as NumPy operations over every series and every candidate
+(alpha, beta, gamma) at the same time. Each series starts from heuristic
+initial states (first week's mean for the level, the week-over-week change for
+the trend, first-week deviations for the seasonals). Parameters come from a
+coarse grid, refined per series by a few rounds of coordinate search around
+the best point, minimizing one-step-ahead squared error.
+"""
+import itertools
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+SEASON = 7
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+BETAS = (0.0, 0.01, 0.05, 0.1, 0.2)
+GAMMAS = (0.0, 0.05, 0.1, 0.2, 0.4)
+REFINE_ROUNDS = 3
+REFINE_STEP = 0.05
+
+def to_matrix(histories):
+    """Right-align the sales of each series into a float matrix.
+
+    Returns (categories, Y, start) where Y[i, start[i]:] holds series i and
+    earlier cells are NaN.
+    """
+    categories = list(histories)
+    lengths = np.array([len(histories[cat]) for cat in categories])
+    width = int(lengths.max())
+    Y = np.full((len(categories), width), np.nan)
+    for i, cat in enumerate(categories):
+        Y[i, width - lengths[i]:] = histories[cat]['sales'].to_numpy(dtype=float)
+    return categories, Y, width - lengths
+
+def initial_states(Y, start):
+    """Heuristic level, trend and seasonals from the first two weeks of each series"""
+    rows = np.arange(len(Y))
+    first = Y[rows[:, None], start[:, None] + np.arange(SEASON)]
+    level = first.mean(axis=1)
+    second_idx = np.minimum(start[:, None] + SEASON + np.arange(SEASON), Y.shape[1] - 1)
+    second = Y[rows[:, None], second_idx]
+    has_second = (Y.shape[1] - start) >= 2 * SEASON
+    trend = np.where(has_second, (second.mean(axis=1) - level) / SEASON, 0.0)
+    seasonals = first - level[:, None]
+    return level, trend, seasonals
+
+def smooth(Y, start, init, alpha, beta, gamma, keep_fitted=False):
+    """Run the recursions for P parameter sets over N series.
+
+    alpha, beta and gamma have shape (P, N). Returns the sum of squared
+    one-step errors (P, N), the final (level, trend, seasonals, slot) and,
+    with keep_fitted, the one-step fitted values (P, N, T).
+    """
+    P, N = alpha.shape
+    level = np.broadcast_to(init[0], (P, N)).copy()
+    trend = np.broadcast_to(init[1], (P, N)).copy()
+    seasonals = np.broadcast_to(init[2], (P, N, SEASON)).copy()
+    sse = np.zeros((P, N))
+    fitted = np.full((P, N, Y.shape[1]), np.nan) if keep_fitted else None
+    p_idx = np.arange(P)[:, None]
+    n_idx = np.arange(N)[None, :]
+
+    for t in range(Y.shape[1]):
+        active = t >= start
+        if not active.any():
+            continue
+        y = Y[:, t]
+        slot = (t - start) % SEASON
+        season = seasonals[p_idx, n_idx, slot[None, :]]
+        forecast = level + trend + season
+        error = np.where(active, y - forecast, 0.0)
+        sse += error ** 2
+        if keep_fitted:
+            fitted[:, :, t] = np.where(active, forecast, np.nan)
+
+        new_level = alpha * (y - season) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        new_season = gamma * (y - level - trend) + (1 - gamma) * season
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        seasonals[p_idx, n_idx, slot[None, :]] = np.where(active, new_season, season)
+
+    final_slot = (Y.shape[1] - start) % SEASON
+    return sse, (level, trend, seasonals, final_slot), fitted
+
+def search(Y, start, init):
+    """Per-series (alpha, beta, gamma) minimizing one-step squared error; each has shape (N,)"""
+    N = len(Y)
+    grid = np.array(list(itertools.product(ALPHAS, BETAS, GAMMAS)))
+    alpha = np.repeat(grid[:, 0:1], N, axis=1)
+    beta = np.repeat(grid[:, 1:2], N, axis=1)
+    gamma = np.repeat(grid[:, 2:3], N, axis=1)
+    sse, _, _ = smooth(Y, start, init, alpha, beta, gamma)
+    best = sse.argmin(axis=0)
+    cols = np.arange(N)
+    params = np.stack([alpha[best, cols], beta[best, cols], gamma[best, cols]])
+    best_sse = sse[best, cols]
+
+    step = REFINE_STEP
+    for _ in range(REFINE_ROUNDS):
+        # Move each parameter of each series by -step, 0 or +step
+        moves = np.array(list(itertools.product((-step, 0.0, step), repeat=3)))
+        candidates = np.clip(params[None, :, :] + moves[:, :, None], 0.0, 1.0)
+        sse, _, _ = smooth(Y, start, init, candidates[:, 0], candidates[:, 1], candidates[:, 2])
+        best = sse.argmin(axis=0)
+        improved = sse[best, cols] < best_sse
+        params = np.where(improved, candidates[best, :, cols].T, params)
+        best_sse = np.minimum(best_sse, sse[best, cols])
+        step /= 2
+    return params
+
+def forecast_many(histories, horizon, batch_size=1000):
+    """Fit every series in `histories` ({category: df with a date index and a `sales` column}).
+
+    Series are fitted batch_size at a time to bound memory. Returns
+    {category: DataFrame(date, forecast, lower, upper)}, clipped at zero like
+    the statsmodels path.
+    """
+    results = {}
+    categories = list(histories)
+    for offset in range(0, len(categories), batch_size):
+        chunk = {cat: histories[cat] for cat in categories[offset:offset + batch_size]}
+        results.update(fit_matrix(chunk, horizon))
+    return results
+
+def forecast_arrays(Y, start, horizon):
+    """Fit right-aligned series (see to_matrix) and forecast `horizon` steps.
+
+    Returns the unclipped point forecasts (N, horizon) and the standard
+    deviation of each series' one-step in-sample errors (N,).
+    """
+    init = initial_states(Y, start)
+    alpha, beta, gamma = search(Y, start, init)
+    _, (level, trend, seasonals, slot), fitted = smooth(
+        Y, start, init, alpha[None, :], beta[None, :], gamma[None, :], keep_fitted=True
+    )
+    level, trend, seasonals, fitted = level[0], trend[0], seasonals[0], fitted[0]
+
+    steps = np.arange(1, horizon + 1)
+    season_idx = (slot[:, None] + steps[None, :] - 1) % SEASON
+    forecasts = level[:, None] + trend[:, None] * steps[None, :] + np.take_along_axis(seasonals, season_idx, axis=1)
+    return forecasts, np.nanstd(fitted - Y, axis=1)
+
+def fit_matrix(histories, horizon):
+    """Fit one matrix of series; see forecast_many"""
+    categories, Y, start = to_matrix(histories)
+    forecasts, std_error = forecast_arrays(Y, start, horizon)
+    margins = 1.96 * std_error[:, None] * np.sqrt(np.arange(1, horizon + 1))[None, :]
+
+    results = {}
+    for i, cat in enumerate(categories):
+        last_date = histories[cat].index.max()
+        results[cat] = pd.DataFrame({
+            'date': pd.date_range(start=last_date + timedelta(days=1), periods=horizon, freq='D'),
+            'forecast': np.clip(forecasts[i], 0, None),
+            'lower': np.clip(forecasts[i] - margins[i], 0, None),
+            'upper': np.clip(forecasts[i] + margins[i], 0, None)
+        })
+    return results
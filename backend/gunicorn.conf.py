@@ -0,0 +1,28 @@
+"""Gunicorn settings for the upload API: `gunicorn -c gunicorn.conf.py upload_service.app:app`.
+
+Each worker process serves GUNICORN_THREADS requests at once, so a slow
+upload or count query occupies one thread rather than the whole server.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+# Worker processes; defaults to one per CPU plus one
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count() + 1)))
+worker_class = 'gthread'
+# Request threads per worker process
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Uploads stream large files, so give requests well beyond gunicorn's 30s default
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '300'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+# The app opens its database engine and Redis client at import, so every worker imports it after the fork
+preload_app = False
+
+# One pooled connection per request thread; workers import common.db after this runs
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
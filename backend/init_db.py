@@ -1,10 +1,121 @@
 import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), ''))
+import argparse
+from datetime import date
+from sqlalchemy import text
 from common.db import engine
 from common.models import Base
 
+# Yearly partitions are kept this many years past the current one; p_max catches anything later
+PARTITION_YEARS_AHEAD = int(os.getenv('PARTITION_YEARS_AHEAD', '2'))
+FIRST_PARTITION_YEAR = 2020
+# Tables range-partitioned by year, with their partitioning column
+PARTITIONED_TABLES = {'invoice_data': 'date', 'forecast_data': 'forecast_date'}
+
+def index_missing(table, index):
+    return (f"SELECT COUNT(*) = 0 FROM information_schema.STATISTICS "
+            f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table}' AND INDEX_NAME = '{index}'")
+
+def index_present(table, index):
+    return (f"SELECT COUNT(*) > 0 FROM information_schema.STATISTICS "
+            f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table}' AND INDEX_NAME = '{index}'")
+
+# Schema changes for databases created before a column or index changed, as
+# (query returning true while the change is still needed, statement)
+MIGRATIONS = [
+    ("SELECT COLUMN_TYPE NOT LIKE '%seasonal_naive%' FROM information_schema.COLUMNS "
+     "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'forecast_data' AND COLUMN_NAME = 'model_type'",
+     "ALTER TABLE forecast_data MODIFY model_type ENUM('prophet','sarimax','holt_winters','seasonal_naive') NOT NULL"),
+    # Sum of the reconciled product forecasts (forecast_service/hierarchy.py)
+    ("SELECT COLUMN_TYPE NOT LIKE '%reconciled%' FROM information_schema.COLUMNS "
+     "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'forecast_data' AND COLUMN_NAME = 'model_type'",
+     "ALTER TABLE forecast_data MODIFY model_type ENUM('prophet','sarimax','holt_winters','seasonal_naive','reconciled') NOT NULL"),
+    # Covering indexes; the single-column ones they replace are prefixes of them or of the primary key
+    (index_missing('invoice_data', 'idx_category_date'),
+     'ALTER TABLE invoice_data ADD INDEX idx_category_date (category, `date`, product_id, sales)'),
+    (index_missing('invoice_data', 'idx_batch_keys'),
+     'ALTER TABLE invoice_data ADD INDEX idx_batch_keys (batch_num, category, `date`)'),
+    (index_present('invoice_data', 'idx_category'), 'ALTER TABLE invoice_data DROP INDEX idx_category'),
+    (index_present('invoice_data', 'idx_batch'), 'ALTER TABLE invoice_data DROP INDEX idx_batch'),
+    (index_present('invoice_data', 'idx_date'), 'ALTER TABLE invoice_data DROP INDEX idx_date'),
+    (index_missing('forecast_data', 'idx_category_model_date'),
+     'ALTER TABLE forecast_data ADD INDEX idx_category_model_date (category, model_type, forecast_date)'),
+    (index_present('forecast_data', 'idx_category'), 'ALTER TABLE forecast_data DROP INDEX idx_category'),
+    (index_present('forecast_data', 'idx_model'), 'ALTER TABLE forecast_data DROP INDEX idx_model'),
+    # Every unique key of a partitioned table must contain the partitioning column
+    ("SELECT COUNT(*) = 0 FROM information_schema.KEY_COLUMN_USAGE WHERE TABLE_SCHEMA = DATABASE() "
+     "AND TABLE_NAME = 'forecast_data' AND CONSTRAINT_NAME = 'PRIMARY' AND COLUMN_NAME = 'forecast_date'",
+     'ALTER TABLE forecast_data DROP PRIMARY KEY, ADD PRIMARY KEY (id, forecast_date)'),
+]
+
+def year_partition(year):
+    return f"PARTITION p{year} VALUES LESS THAN ('{year + 1}-01-01')"
+
+def partition_names(conn, table):
+    rows = conn.execute(text(
+        'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL'
+    ), {'table': table})
+    return {row[0] for row in rows}
+
+def ensure_partitions(conn, table, column):
+    """Partition a table by year if it is not yet, otherwise split p_max so the coming years have partitions"""
+    last_year = date.today().year + PARTITION_YEARS_AHEAD
+    names = partition_names(conn, table)
+    if not names:
+        print(f'Partitioning {table} by year of {column} ...')
+        partitions = [f"PARTITION p_min VALUES LESS THAN ('{FIRST_PARTITION_YEAR}-01-01')"]
+        partitions += [year_partition(year) for year in range(FIRST_PARTITION_YEAR, last_year + 1)]
+        partitions.append('PARTITION p_max VALUES LESS THAN (MAXVALUE)')
+        conn.execute(text(f'ALTER TABLE {table} PARTITION BY RANGE COLUMNS(`{column}`) ({", ".join(partitions)})'))
+        return
+    years = [int(name[1:]) for name in names if name[1:].isdigit()]
+    missing = range(max(years, default=FIRST_PARTITION_YEAR - 1) + 1, last_year + 1)
+    if missing:
+        print(f'Adding {table} partitions for {list(missing)} ...')
+        partitions = [year_partition(year) for year in missing]
+        partitions.append('PARTITION p_max VALUES LESS THAN (MAXVALUE)')
+        conn.execute(text(f'ALTER TABLE {table} REORGANIZE PARTITION p_max INTO ({", ".join(partitions)})'))
+
+def drop_partitions_before(conn, table, year):
+    """Drop the yearly partitions (and p_min) that only hold rows from before `year`"""
+    names = partition_names(conn, table)
+    old = sorted(name for name in names if name == 'p_min' or (name[1:].isdigit() and int(name[1:]) < year))
+    if old:
+        print(f'Dropping {table} partitions {old} ...')
+        conn.execute(text(f'ALTER TABLE {table} DROP PARTITION {", ".join(old)}'))
+
+def migrate():
+    with engine.begin() as conn:
+        for needed, statement in MIGRATIONS:
+            if conn.execute(text(needed)).scalar():
+                print(f'Migrating: {statement}')
+                conn.execute(text(statement))
+        for table, column in PARTITIONED_TABLES.items():
+            ensure_partitions(conn, table, column)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create, migrate and maintain the database schema')
+    parser.add_argument('--drop-before', type=int, metavar='YEAR',
+                        help='drop invoice_data and forecast_data partitions older than YEAR')
+    args = parser.parse_args()
+
     print('Creating tables (if not exists) ...')
     Base.metadata.create_all(bind=engine)
+    if engine.dialect.name == 'mysql':
+        migrate()
+        if args.drop_before:
+            with engine.begin() as conn:
+                for table in PARTITIONED_TABLES:
+                    drop_partitions_before(conn, table, args.drop_before)
+    with engine.begin() as conn:
+        # Populate the daily rollup once for data loaded before the table existed
+        empty = conn.execute(text('SELECT COUNT(*) FROM daily_category_sales')).scalar() == 0
+        if empty:
+            print('Backfilling daily_category_sales ...')
+            conn.execute(text(
+                'INSERT INTO daily_category_sales (`date`, category, sales) '
+                'SELECT `date`, category, SUM(sales) FROM invoice_data GROUP BY `date`, category'
+            ))
     print('Done')
@@ -0,0 +1,37 @@
+"""Run the services against SQLite and an in-memory Redis, like the benchmarks do.
+
+The services create their engine and Redis client at import time, so the
+environment is set up here, before any test module imports them.
+"""
+import os
+import sys
+import tempfile
+import fakeredis
+import pytest
+import redis
+
+WORKDIR = tempfile.mkdtemp(prefix='sales_tests_')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(WORKDIR, "test.db")}'
+os.environ['UPLOAD_DIR'] = WORKDIR
+# SQLite has no INSERT ... ON DUPLICATE KEY UPDATE; the row-by-row load path runs on it for new rows
+os.environ['ETL_LOAD_MODE'] = 'row'
+os.environ['ETL_STAGE_COLUMNAR'] = 'false'
+FAKE_REDIS = fakeredis.FakeRedis()
+redis.from_url = lambda *a, **k: FAKE_REDIS
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+@pytest.fixture
+def fake_redis():
+    FAKE_REDIS.flushall()
+    return FAKE_REDIS
+
+@pytest.fixture
+def database():
+    """Empty tables in the test database"""
+    from sqlalchemy.orm import close_all_sessions
+    from common.db import engine
+    from common.models import Base
+    close_all_sessions()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return engine
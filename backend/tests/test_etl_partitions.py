@@ -0,0 +1,98 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from common import work_queue
+from common.models import UploadMetadata
+
+ROWS = 300
+PARTITIONS = 3
+
+@pytest.fixture
+def etl(database, fake_redis, monkeypatch):
+    from etl_service import etl_worker
+    # The batch rollup is MySQL-only SQL
+    monkeypatch.setattr(etl_worker, 'finalize_partitions', lambda batch_num: None)
+    monkeypatch.setattr(etl_worker.time, 'sleep', lambda seconds: None)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Date': np.repeat(pd.date_range('2026-01-01', periods=ROWS // 10).strftime('%Y-%m-%d'), 10),
+        'product_id': [f'P{i % 10}' for i in range(ROWS)],
+        'category': [f'C{i % 3}' for i in range(ROWS)],
+        'sales': rng.uniform(1, 100, ROWS).round(2),
+    })
+    df.to_csv(os.path.join(etl_worker.UPLOAD_DIR, 'upload.csv'), index=False)
+    etl_worker.DB.add(UploadMetadata(
+        batch_num='b1', original_filename='upload.csv', stored_filename='upload.csv', file_hash='h1', status='processing',
+        num_total_rows=0, num_missing_rows=0, num_imputed_rows=0, num_inserted_rows=0, num_updated_rows=0,
+    ))
+    etl_worker.DB.commit()
+    return etl_worker
+
+def partition_jobs(etl):
+    path = os.path.join(etl.UPLOAD_DIR, 'upload.csv')
+    return [
+        {'batch_num': 'b1', 'stored_filename': 'upload.csv', 'partition': i, 'partitions': PARTITIONS, 'start': start, 'end': end}
+        for i, (start, end) in enumerate(etl.partition_ranges(path, PARTITIONS))
+    ]
+
+def batch_state(etl):
+    etl.DB.expire_all()
+    metadata = etl.DB.query(UploadMetadata).filter(UploadMetadata.batch_num == 'b1').one()
+    with etl.engine.connect() as conn:
+        ledger = conn.execute(text('SELECT COUNT(*) FROM etl_partition_ledger')).scalar()
+        rows = conn.execute(text('SELECT COUNT(*) FROM invoice_data')).scalar()
+    return metadata.status, metadata.num_total_rows, metadata.num_inserted_rows, ledger, rows
+
+def test_redelivered_partitions_are_counted_once(etl):
+    jobs = partition_jobs(etl)
+    for job in jobs + jobs:
+        etl.process_partition(job)
+    assert batch_state(etl) == ('processing', ROWS, ROWS, PARTITIONS, ROWS)
+
+def test_deadlock_is_retried(etl, monkeypatch):
+    load_partition = etl.load_partition
+    calls = []
+
+    def deadlock_once(conn, job, metadata):
+        calls.append(job['partition'])
+        if len(calls) == 1:
+            raise OperationalError('INSERT INTO invoice_data', {}, Exception(1213, 'Deadlock found'))
+        return load_partition(conn, job, metadata)
+
+    monkeypatch.setattr(etl, 'load_partition', deadlock_once)
+    job = partition_jobs(etl)[0]
+    etl.process_partition(job)
+    status, total, inserted, ledger, rows = batch_state(etl)
+    assert calls == [0, 0]
+    assert (status, ledger) == ('processing', 1)
+    assert total == inserted == rows > 0
+
+def test_failed_partition_releases_its_ledger_row(etl, monkeypatch):
+    def broken(conn, job, metadata):
+        raise ValueError('bad chunk')
+
+    monkeypatch.setattr(etl, 'load_partition', broken)
+    etl.process_partition(partition_jobs(etl)[0])
+    assert batch_state(etl) == ('failed', 0, 0, 0, 0)
+
+def test_redelivered_plan_job_leaves_the_batch_alone(etl, monkeypatch):
+    monkeypatch.setattr(etl, 'ETL_PARTITION_BYTES', 1000)
+    [plan] = work_queue.push(etl.r, etl.ETL_QUEUE, {'batch_num': 'b1', 'stored_filename': 'upload.csv'})
+    etl.handle_job(json.loads(work_queue.reserve(etl.r, etl.ETL_QUEUE, timeout=0)))
+    queued = etl.r.llen(etl.ETL_QUEUE)
+    assert queued > 1
+    while True:
+        payload = work_queue.reserve(etl.r, etl.ETL_QUEUE, timeout=0)
+        if payload is None:
+            break
+        etl.handle_job(json.loads(payload))
+    loaded = batch_state(etl)
+    assert loaded == ('processing', ROWS, ROWS, queued, ROWS)
+
+    etl.handle_job(json.loads(plan))
+    assert etl.r.llen(etl.ETL_QUEUE) == 0
+    assert batch_state(etl) == loaded
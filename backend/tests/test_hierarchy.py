@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from forecast_service import hierarchy
+
+def test_category_totals_are_the_sum_of_the_products():
+    dates = pd.date_range('2026-02-01', periods=2).date
+    forecasts = pd.DataFrame({
+        'category': ['A'] * 4 + ['B'] * 2,
+        'product_id': ['P1', 'P1', 'P2', 'P2', 'P3', 'P3'],
+        'forecast_date': list(dates) * 3,
+        'forecast_value': [1.25, 2.0, 3.5, 0.0, 0.0, 4.0],
+        'lower_bound': [0.0] * 6,
+        'upper_bound': [4.25, 6.0, 7.5, 3.0, 0.5, 5.0],
+        'reconciliation': 'mint',
+    })
+    totals = hierarchy.category_totals(forecasts).set_index(['category', 'forecast_date'])
+
+    expected = forecasts.groupby(['category', 'forecast_date'])['forecast_value'].sum()
+    assert np.allclose(totals['forecast_value'], expected.reindex(totals.index))
+    assert (totals['model_type'] == 'reconciled').all()
+    # Margins add in quadrature: sqrt(3^2 + 4^2) = 5 for A on the first day
+    assert totals.loc[('A', dates[0]), 'upper_bound'] == 9.75
+    assert totals.loc[('A', dates[0]), 'lower_bound'] == 0.0
+    assert (totals['lower_bound'] >= 0).all()
+
+def test_mint_moves_the_gap_onto_the_noisier_products():
+    bottom = np.array([[10.0, 10.0], [10.0, 10.0]])
+    reconciled = hierarchy.reconcile(np.array([26.0, 26.0]), 1.0, bottom, np.array([1.0, 2.0]), 'mint')
+    gain = reconciled - bottom
+    assert np.allclose(gain[1], 4 * gain[0])
+    assert np.all(reconciled.sum(axis=0) > bottom.sum(axis=0))
+    assert np.all(reconciled.sum(axis=0) < 26.0)
@@ -0,0 +1,70 @@
+import json
+import time
+from common import work_queue
+
+QUEUE = 'test_queue'
+
+def lease_key(payload):
+    return work_queue._item_key(QUEUE, 'lease', payload)
+
+def test_reserve_and_ack(fake_redis):
+    [payload] = work_queue.push(fake_redis, QUEUE, {'batch_num': 'b1'})
+    assert work_queue.reserve(fake_redis, QUEUE, timeout=0) == payload.encode('utf-8')
+    assert fake_redis.lrange(work_queue.processing_key(QUEUE), 0, -1) == [payload.encode('utf-8')]
+    assert fake_redis.exists(lease_key(payload))
+
+    work_queue.ack(fake_redis, QUEUE, payload)
+    assert fake_redis.llen(work_queue.processing_key(QUEUE)) == 0
+    assert not fake_redis.exists(lease_key(payload))
+    assert work_queue.reserve(fake_redis, QUEUE, timeout=0) is None
+
+def test_identical_items_get_separate_leases(fake_redis):
+    first, second = work_queue.push(fake_redis, QUEUE, {'category': 'A'}, {'category': 'A'})
+    assert json.loads(first)['id'] != json.loads(second)['id']
+    work_queue.reserve(fake_redis, QUEUE, timeout=0)
+    work_queue.reserve(fake_redis, QUEUE, timeout=0)
+
+    work_queue.ack(fake_redis, QUEUE, first)
+    assert work_queue.reclaim(fake_redis, QUEUE) == 0
+    assert work_queue.reclaim(fake_redis, QUEUE) == 0
+    assert fake_redis.lrange(work_queue.processing_key(QUEUE), 0, -1) == [second.encode('utf-8')]
+
+def test_reclaim_requeues_expired_lease_on_second_pass(fake_redis):
+    [payload] = work_queue.push(fake_redis, QUEUE, {'batch_num': 'b1'})
+    work_queue.reserve(fake_redis, QUEUE, timeout=0)
+    fake_redis.delete(lease_key(payload))
+
+    assert work_queue.reclaim(fake_redis, QUEUE) == 0
+    assert work_queue.reclaim(fake_redis, QUEUE) == 1
+    assert fake_redis.lrange(QUEUE, 0, -1) == [payload.encode('utf-8')]
+    assert fake_redis.llen(work_queue.processing_key(QUEUE)) == 0
+
+def test_renew_extends_lease_and_clears_suspect_mark(fake_redis):
+    [payload] = work_queue.push(fake_redis, QUEUE, {'batch_num': 'b1'})
+    work_queue.reserve(fake_redis, QUEUE, timeout=0)
+    fake_redis.delete(lease_key(payload))
+    assert work_queue.reclaim(fake_redis, QUEUE) == 0
+
+    work_queue.renew(fake_redis, QUEUE, payload)
+    assert fake_redis.ttl(lease_key(payload)) > work_queue.LEASE_SECONDS - 5
+    assert work_queue.reclaim(fake_redis, QUEUE) == 0
+    fake_redis.delete(lease_key(payload))
+    # The suspect mark was cleared, so an expired lease again takes two passes
+    assert work_queue.reclaim(fake_redis, QUEUE) == 0
+
+def test_heartbeat_renews_until_the_block_ends(fake_redis, monkeypatch):
+    monkeypatch.setattr(work_queue, 'HEARTBEAT_SECONDS', 0.05)
+    [payload] = work_queue.push(fake_redis, QUEUE, {'batch_num': 'b1'})
+    work_queue.reserve(fake_redis, QUEUE, timeout=0)
+    with work_queue.heartbeat(fake_redis, QUEUE, [payload]):
+        fake_redis.delete(lease_key(payload))
+        time.sleep(0.2)
+        assert fake_redis.exists(lease_key(payload))
+    fake_redis.delete(lease_key(payload))
+    time.sleep(0.2)
+    assert not fake_redis.exists(lease_key(payload))
+
+def test_payloads_without_id_are_keyed_on_their_content():
+    assert work_queue.item_id(b'20260101') == work_queue.item_id('20260101')
+    assert work_queue.item_id(b'20260101') != work_queue.item_id(b'20260102')
+    assert work_queue.item_id(json.dumps({'id': 'abc', 'batch_num': 'b1'})) == 'abc'
@@ -1,76 +1,204 @@
 import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import base64
+import csv
 import hashlib
+import io
+import json
+import tempfile
 import time
 import uuid
-from flask import Flask, request, jsonify
+from datetime import date
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import text
+from sqlalchemy import func, literal, select, text, tuple_
+from common import metrics, work_queue
+from common.cache import ResponseCache, bump_versions
 from common.db import SessionLocal, engine
-from common.models import UploadMetadata, InvoiceData, ForecastData
+from common.models import UploadMetadata, InvoiceData, DailyCategorySales, ForecastData, ProductForecastData
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow export is optional
+    pa = None
 
 UPLOAD_DIR = os.getenv('UPLOAD_DIR', '/app/data/uploaded_files')
 REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Forecast-Pending'])
 app.config['UPLOAD_DIR'] = UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 import redis
 r = redis.from_url(REDIS_URL)
+response_cache = ResponseCache(r)
 
 def get_db():
-    """Get a new database session for each request"""
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        pass  # Session will be closed after use
+    """Database session for the current request, opened on first use and closed by close_db"""
+    if 'db' not in g:
+        g.db = SessionLocal()
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exc):
+    """Return the request's connection to the pool, rolling back anything left uncommitted"""
+    db = g.pop('db', None)
+    if db is not None:
+        if exc is not None:
+            db.rollback()
+        db.close()
+
+COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', '60'))
+# Models the forecast worker may skip for low-volume categories and computes when first read
+ON_DEMAND_MODELS = ('prophet', 'sarimax')
+ON_DEMAND_RETRY = int(os.getenv('FORECAST_ON_DEMAND_RETRY', '600'))
+UPLOAD_CHUNK_BYTES = int(os.getenv('UPLOAD_CHUNK_BYTES', str(1024 * 1024)))
+# Rows fetched from the server-side cursor and written per chunk of a streamed export
+EXPORT_BATCH_ROWS = int(os.getenv('EXPORT_BATCH_ROWS', '5000'))
 
 ALLOWED_EXTENSIONS = {'csv'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def encode_cursor(item):
+    """Encode the primary key of the last row of a page as an opaque cursor"""
+    key = json.dumps([item.date.isoformat(), item.product_id, item.category])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a cursor into (date, product_id, category); raises ValueError if malformed"""
+    try:
+        last_date, product_id, category = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return date.fromisoformat(last_date), str(product_id), str(category)
+    except Exception as e:
+        raise ValueError(f'invalid cursor: {e}')
+
+def cached_count(query, filters):
+    """Count the rows matched by a query, caching the total in Redis for COUNT_CACHE_TTL seconds"""
+    key = 'invoice_count:' + hashlib.sha256(json.dumps(filters, sort_keys=True).encode('utf-8')).hexdigest()
+    try:
+        cached = r.get(key)
+        if cached is not None:
+            return int(cached)
+    except redis.RedisError:
+        pass
+    total = query.order_by(None).with_entities(func.count(InvoiceData.date)).scalar()
+    try:
+        r.setex(key, COUNT_CACHE_TTL, total)
+    except redis.RedisError:
+        pass
+    return total
+
+def stream_to_temp(stream):
+    """Copy an upload stream to a temp file in UPLOAD_DIR in fixed-size chunks.
+
+    Returns (temp path, SHA-256 hex digest) without holding the file in memory.
+    """
+    sha = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=app.config['UPLOAD_DIR'], suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, sha.hexdigest()
+
+def skipped_models(category):
+    """Heavy models the forecast worker's tiering left out of the category's latest forecast.
+
+    Only these are fitted on demand: a model that was attempted and failed
+    (for example SARIMAX on a short history) is not listed, so its absence
+    does not keep a response pending.
+    """
+    try:
+        return sorted(m.decode('utf-8') for m in r.smembers(f'forecast_skipped:{category}'))
+    except redis.RedisError as e:
+        print(f"Could not read skipped models of {category}: {e}")
+        return []
+
+def request_forecasts(category, models):
+    """Queue a high-priority fit of heavy models for a category and mark it hot.
+
+    Each (category, model) is queued at most once per ON_DEMAND_RETRY seconds.
+    Returns the models that are pending.
+    """
+    try:
+        r.zadd('forecast_hot', {category: time.time()})
+        queued = [m for m in models if r.set(f'forecast_requested:{category}:{m}', 1, nx=True, ex=ON_DEMAND_RETRY)]
+        if queued:
+            work_queue.push(r, 'forecast_priority', {'category': category, 'models': queued})
+    except redis.RedisError as e:
+        print(f"Could not queue on-demand forecast for {category}: {e}")
+        return []
+    return list(models)
+
+@app.before_request
+def start_timer():
+    g.started_at = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Record handler latency per endpoint and status, then publish this process's snapshot"""
+    started_at = g.pop('started_at', None)
+    if started_at is not None and request.endpoint != 'metrics_text':
+        metrics.observe('api_request', time.perf_counter() - started_at,
+                        endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code)
+        metrics.push(r, 'api')
+    return response
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics_text():
+    """Prometheus metrics of the API and every worker that pushed recently, plus queue depths"""
+    try:
+        metrics.push(r, 'api', force=True)
+        body = metrics.render(r)
+    except redis.RedisError as e:
+        return jsonify({'error': f'metrics unavailable: {e}'}), 503
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     db = get_db()
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'no file provided'}), 400
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'empty filename'}), 400
-        if not allowed_file(file.filename):
-            return jsonify({'error': 'only csv allowed'}), 400
-
-        original_filename = secure_filename(file.filename)
-        # read to memory to compute hash
-        content = file.read()
-        sha = hashlib.sha256(content).hexdigest()
+    if 'file' not in request.files:
+        return jsonify({'error': 'no file provided'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'empty filename'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'only csv allowed'}), 400
 
+    original_filename = secure_filename(file.filename)
+    # stream to a temp file next to the final location, hashing chunk by chunk
+    tmp_path, sha = stream_to_temp(file.stream)
+    try:
         existing = db.query(UploadMetadata).filter(UploadMetadata.file_hash == sha).first()
         if existing:
             return jsonify({'error': 'duplicate file', 'batch_num': existing.batch_num}), 409
 
+        stem = os.path.splitext(original_filename)[0]
         ts = int(time.time())
-        stored_filename = f"{os.path.splitext(original_filename)[0]}_{ts}_{sha[:8]}.csv"
+        suffix = uuid.uuid4().hex[:6]
+        batch_num = f"{stem}_{ts}_{suffix}"
+        stored_filename = f"{stem}_{ts}_{sha[:8]}_{suffix}.csv"
         stored_path = os.path.join(app.config['UPLOAD_DIR'], stored_filename)
 
-        # write file
-        with open(stored_path, 'wb') as f:
-            f.write(content)
-
-        batch_num = f"{os.path.splitext(original_filename)[0]}_{ts}_{uuid.uuid4().hex[:6]}"
-
+        # claim the file hash before the file takes its final name, so a request
+        # that loses a concurrent upload of the same file only drops its own temp file
         metadata = UploadMetadata(
             batch_num=batch_num,
             original_filename=original_filename,
@@ -85,128 +213,395 @@ def upload_file():
             db.rollback()
             return jsonify({'error': 'db error', 'detail': str(e)}), 500
 
-        # push ETL job to redis list
-        job_payload = {'batch_num': batch_num, 'stored_filename': stored_filename}
-        r.lpush('etl_queue', str(job_payload))
-
-        return jsonify({'message': 'file accepted', 'batch_num': batch_num}), 201
+        try:
+            # atomic rename: the ETL never sees a partially written file
+            os.replace(tmp_path, stored_path)
+        except OSError as e:
+            db.delete(metadata)
+            db.commit()
+            return jsonify({'error': 'could not store file', 'detail': str(e)}), 500
     finally:
-        db.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    bump_versions(r, ['metadata'])
+
+    # push ETL job to redis list
+    job_payload = {'batch_num': batch_num, 'stored_filename': stored_filename}
+    work_queue.push(r, 'etl_queue', job_payload)
+
+    return jsonify({'message': 'file accepted', 'batch_num': batch_num}), 201
 
 @app.route('/metadata', methods=['GET'])
 def metadata_list():
+    cache_key = response_cache.key('metadata', 'metadata', request.args.to_dict())
+    body = response_cache.get(cache_key)
+    if body is not None:
+        return app.response_class(body, mimetype='application/json')
+
     db = get_db()
-    try:
-        items = db.query(UploadMetadata).order_by(UploadMetadata.uploaded_at.desc()).limit(100).all()
-        result = []
-        for m in items:
-            result.append({
-                'batch_num': m.batch_num,
-                'original_filename': m.original_filename,
-                'stored_filename': m.stored_filename,
-                'file_hash': m.file_hash,
-                'uploaded_at': m.uploaded_at.isoformat() if m.uploaded_at else None,
-                'num_total_rows': m.num_total_rows,
-                'num_missing_rows': m.num_missing_rows,
-                'num_imputed_rows': m.num_imputed_rows,
-                'num_inserted_rows': m.num_inserted_rows,
-                'num_updated_rows': m.num_updated_rows,
-                'status': m.status,
-                'error_log': m.error_log
-            })
-        return jsonify(result)
-    finally:
-        db.close()
+    items = db.query(UploadMetadata).order_by(UploadMetadata.uploaded_at.desc()).limit(100).all()
+    result = []
+    for m in items:
+        result.append({
+            'batch_num': m.batch_num,
+            'original_filename': m.original_filename,
+            'stored_filename': m.stored_filename,
+            'file_hash': m.file_hash,
+            'uploaded_at': m.uploaded_at.isoformat() if m.uploaded_at else None,
+            'num_total_rows': m.num_total_rows,
+            'num_missing_rows': m.num_missing_rows,
+            'num_imputed_rows': m.num_imputed_rows,
+            'num_inserted_rows': m.num_inserted_rows,
+            'num_updated_rows': m.num_updated_rows,
+            'status': m.status,
+            'error_log': m.error_log
+        })
+    body = json.dumps(result)
+    response_cache.set(cache_key, body)
+    return app.response_class(body, mimetype='application/json')
 
 @app.route('/invoice-data', methods=['GET'])
 def invoice_data_list():
-    """Get invoice data with optional filtering by category, batch_num and date range"""
+    """Get invoice data with optional filtering by category, batch_num and date range.
+
+    Pages with `page`/`limit` by default. Passing `cursor` (empty for the first
+    page) switches to keyset pagination over the (date, product_id, category)
+    primary key; totals are then only returned when `with_count=true`.
+    """
     db = get_db()
-    try:
-        category = request.args.get('category')
-        batch_num = request.args.get('batch_num')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 15))
-        
-        query = db.query(InvoiceData)
-        
-        if category:
-            query = query.filter(InvoiceData.category == category)
-        if batch_num:
-            query = query.filter(InvoiceData.batch_num == batch_num)
-        if start_date:
-            query = query.filter(InvoiceData.date >= start_date)
-        if end_date:
-            query = query.filter(InvoiceData.date <= end_date)
-        
-        total_items = query.count()
-        total_pages = (total_items + limit - 1) // limit
-
-        items = query.order_by(InvoiceData.date.desc()).offset((page - 1) * limit).limit(limit).all()
-        result = []
-        for item in items:
-            result.append({
-                'date': item.date.isoformat() if item.date else None,
-                'product_id': item.product_id,
-                'category': item.category,
-                'sales': float(item.sales),
-                'is_imputed': item.is_imputed,
-                'batch_num': item.batch_num,
-                'version': item.version
-            })
-        
-        return jsonify({
-            'data': result,
-            'pagination': {
-                'page': page,
-                'limit': limit,
-                'total_items': total_items,
-                'total_pages': total_pages
-            }
+    category = request.args.get('category')
+    batch_num = request.args.get('batch_num')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    page = int(request.args.get('page', 1))
+    limit = int(request.args.get('limit', 15))
+    cursor = request.args.get('cursor')
+    
+    query = db.query(InvoiceData)
+    
+    if category:
+        query = query.filter(InvoiceData.category == category)
+    if batch_num:
+        query = query.filter(InvoiceData.batch_num == batch_num)
+    if start_date:
+        query = query.filter(InvoiceData.date >= start_date)
+    if end_date:
+        query = query.filter(InvoiceData.date <= end_date)
+
+    filters = {'category': category, 'batch_num': batch_num, 'start_date': start_date, 'end_date': end_date}
+    order = (InvoiceData.date.desc(), InvoiceData.product_id.desc(), InvoiceData.category.desc())
+
+    if cursor is not None:
+        if cursor:
+            try:
+                last_date, last_product_id, last_category = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'invalid cursor'}), 400
+            query_page = query.filter(
+                tuple_(InvoiceData.date, InvoiceData.product_id, InvoiceData.category)
+                < tuple_(literal(last_date), literal(last_product_id), literal(last_category))
+            )
+        else:
+            query_page = query
+        # Fetch one extra row to know whether another page exists
+        items = query_page.order_by(*order).limit(limit + 1).all()
+        has_more = len(items) > limit
+        items = items[:limit]
+        pagination = {
+            'limit': limit,
+            'next_cursor': encode_cursor(items[-1]) if has_more else None,
+            'has_more': has_more
+        }
+        if request.args.get('with_count', 'false').lower() == 'true':
+            pagination['total_items'] = cached_count(query, filters)
+    else:
+        total_items = cached_count(query, filters)
+        items = query.order_by(*order).offset((page - 1) * limit).limit(limit).all()
+        pagination = {
+            'page': page,
+            'limit': limit,
+            'total_items': total_items,
+            'total_pages': (total_items + limit - 1) // limit
+        }
+
+    result = []
+    for item in items:
+        result.append({
+            'date': item.date.isoformat() if item.date else None,
+            'product_id': item.product_id,
+            'category': item.category,
+            'sales': float(item.sales),
+            'is_imputed': item.is_imputed,
+            'batch_num': item.batch_num,
+            'version': item.version
         })
-    finally:
-        db.close()
+    
+    return jsonify({
+        'data': result,
+        'pagination': pagination
+    })
+
+@app.route('/categories', methods=['GET'])
+def category_list():
+    """Get the sorted list of distinct categories"""
+    db = get_db()
+    rows = db.query(DailyCategorySales.category).distinct().order_by(DailyCategorySales.category).all()
+    return jsonify([row[0] for row in rows])
+
+@app.route('/daily-sales', methods=['GET'])
+def daily_sales_list():
+    """Get precomputed daily sales totals per category with optional filtering by category and date range.
+
+    Returns the latest `limit` days in ascending date order.
+    """
+    db = get_db()
+    category = request.args.get('category')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    limit = int(request.args.get('limit', 1000))
+
+    query = db.query(DailyCategorySales)
+
+    if category:
+        query = query.filter(DailyCategorySales.category == category)
+    if start_date:
+        query = query.filter(DailyCategorySales.date >= start_date)
+    if end_date:
+        query = query.filter(DailyCategorySales.date <= end_date)
+
+    items = query.order_by(DailyCategorySales.date.desc()).limit(limit).all()
+    result = []
+    for item in reversed(items):
+        result.append({
+            'date': item.date.isoformat() if item.date else None,
+            'category': item.category,
+            'sales': float(item.sales)
+        })
+    return jsonify(result)
 
 @app.route('/forecast-data', methods=['GET'])
 def forecast_data_list():
-    """Get forecast data with optional filtering by category and model type"""
+    """Get forecast data with optional filtering by category and model type.
+
+    When a category is given and tiering skipped a heavy model in its latest
+    forecast, a fit is queued and the model is listed in the
+    X-Forecast-Pending header; such responses are not cached.
+    """
+    category = request.args.get('category')
+    # Responses for one category are invalidated when that category is re-forecast,
+    # unfiltered responses whenever any category is
+    scope = f'forecast:{category}' if category else 'forecast:*'
+    cache_key = response_cache.key('forecast-data', scope, request.args.to_dict())
+    body = response_cache.get(cache_key)
+    if body is not None:
+        return app.response_class(body, mimetype='application/json')
+
     db = get_db()
+    model_type = request.args.get('model_type')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    limit = int(request.args.get('limit', 1000))
+    
+    query = db.query(ForecastData)
+    
+    if category:
+        query = query.filter(ForecastData.category == category)
+    if model_type:
+        query = query.filter(ForecastData.model_type == model_type)
+    if start_date:
+        query = query.filter(ForecastData.forecast_date >= start_date)
+    if end_date:
+        query = query.filter(ForecastData.forecast_date <= end_date)
+    
+    items = query.order_by(ForecastData.forecast_date.desc()).limit(limit).all()
+    result = []
+    for item in items:
+        result.append({
+            'id': item.id,
+            'forecast_date': item.forecast_date.isoformat() if item.forecast_date else None,
+            'category': item.category,
+            'model_type': item.model_type,
+            'forecast_value': float(item.forecast_value),
+            'lower_bound': float(item.lower_bound) if item.lower_bound else None,
+            'upper_bound': float(item.upper_bound) if item.upper_bound else None,
+            'batch_num': item.batch_num
+        })
+    body = json.dumps(result)
+
+    pending = []
+    if category:
+        wanted = [model_type] if model_type else ON_DEMAND_MODELS
+        missing = [m for m in skipped_models(category) if m in wanted]
+        if missing:
+            pending = request_forecasts(category, missing)
+    if pending:
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['X-Forecast-Pending'] = ','.join(pending)
+        return response
+
+    response_cache.set(cache_key, body)
+    return app.response_class(body, mimetype='application/json')
+
+@app.route('/product-forecast-data', methods=['GET'])
+def product_forecast_data_list():
+    """Get the reconciled product forecasts of one category, optionally for one product and date range"""
+    category = request.args.get('category')
+    if not category:
+        return jsonify({'error': 'category is required'}), 400
+    cache_key = response_cache.key('product-forecast-data', f'product_forecast:{category}', request.args.to_dict())
+    body = response_cache.get(cache_key)
+    if body is not None:
+        return app.response_class(body, mimetype='application/json')
+
+    db = get_db()
+    product_id = request.args.get('product_id')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    limit = int(request.args.get('limit', 1000))
+
+    query = db.query(ProductForecastData).filter(ProductForecastData.category == category)
+    if product_id:
+        query = query.filter(ProductForecastData.product_id == product_id)
+    if start_date:
+        query = query.filter(ProductForecastData.forecast_date >= start_date)
+    if end_date:
+        query = query.filter(ProductForecastData.forecast_date <= end_date)
+
+    items = query.order_by(ProductForecastData.product_id, ProductForecastData.forecast_date).limit(limit).all()
+    result = [{
+        'forecast_date': item.forecast_date.isoformat(),
+        'category': item.category,
+        'product_id': item.product_id,
+        'forecast_value': float(item.forecast_value),
+        'lower_bound': float(item.lower_bound) if item.lower_bound is not None else None,
+        'upper_bound': float(item.upper_bound) if item.upper_bound is not None else None,
+        'reconciliation': item.reconciliation,
+        'batch_num': item.batch_num
+    } for item in items]
+    body = json.dumps(result)
+    response_cache.set(cache_key, body)
+    return app.response_class(body, mimetype='application/json')
+
+EXPORT_COLUMNS = ['forecast_date', 'category', 'model_type', 'forecast_value', 'lower_bound', 'upper_bound', 'batch_num']
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+}
+
+class ChunkSink(io.RawIOBase):
+    """Write target for the Arrow stream writer that hands back what was written since the last take()"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_batches(query):
+    """Yield lists of export rows from a server-side cursor, EXPORT_BATCH_ROWS at a time"""
+    conn = engine.connect().execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS)
     try:
-        category = request.args.get('category')
-        model_type = request.args.get('model_type')
-        start_date = request.args.get('start_date')
-        end_date = request.args.get('end_date')
-        limit = int(request.args.get('limit', 1000))
-        
-        query = db.query(ForecastData)
-        
-        if category:
-            query = query.filter(ForecastData.category == category)
-        if model_type:
-            query = query.filter(ForecastData.model_type == model_type)
-        if start_date:
-            query = query.filter(ForecastData.forecast_date >= start_date)
-        if end_date:
-            query = query.filter(ForecastData.forecast_date <= end_date)
-        
-        items = query.order_by(ForecastData.forecast_date.desc()).limit(limit).all()
-        result = []
-        for item in items:
-            result.append({
-                'id': item.id,
-                'forecast_date': item.forecast_date.isoformat() if item.forecast_date else None,
-                'category': item.category,
-                'model_type': item.model_type,
-                'forecast_value': float(item.forecast_value),
-                'lower_bound': float(item.lower_bound) if item.lower_bound else None,
-                'upper_bound': float(item.upper_bound) if item.upper_bound else None,
-                'batch_num': item.batch_num
-            })
-        return jsonify(result)
+        for rows in conn.execute(query).partitions():
+            yield rows
     finally:
-        db.close()
+        conn.close()
+
+def export_ndjson(batches):
+    for rows in batches:
+        yield ''.join(json.dumps({
+            'forecast_date': row.forecast_date.isoformat(),
+            'category': row.category,
+            'model_type': row.model_type,
+            'forecast_value': float(row.forecast_value),
+            'lower_bound': float(row.lower_bound) if row.lower_bound is not None else None,
+            'upper_bound': float(row.upper_bound) if row.upper_bound is not None else None,
+            'batch_num': row.batch_num
+        }) + '\n' for row in rows)
+
+def export_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_arrow(batches):
+    schema = pa.schema([
+        ('forecast_date', pa.date32()),
+        ('category', pa.string()),
+        ('model_type', pa.string()),
+        ('forecast_value', pa.float64()),
+        ('lower_bound', pa.float64()),
+        ('upper_bound', pa.float64()),
+        ('batch_num', pa.string()),
+    ])
+    sink = ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    yield sink.take()
+    for rows in batches:
+        columns = list(zip(*rows))
+        arrays = [
+            pa.array(columns[0], pa.date32()),
+            pa.array(columns[1], pa.string()),
+            pa.array(columns[2], pa.string()),
+            *(pa.array([float(v) if v is not None else None for v in column], pa.float64()) for column in columns[3:6]),
+            pa.array(columns[6], pa.string()),
+        ]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+@app.route('/forecast-export', methods=['GET'])
+def forecast_export():
+    """Stream every forecast matching the filters as NDJSON (default), CSV or Arrow IPC.
+
+    Rows come from a server-side cursor and are written as they arrive, so
+    memory use and time to first byte do not depend on the export size.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'format must be one of {sorted(EXPORT_FORMATS)}'}), 400
+    if export_format == 'arrow' and pa is None:
+        return jsonify({'error': 'arrow export requires pyarrow'}), 400
+
+    query = select(*(getattr(ForecastData, column) for column in EXPORT_COLUMNS))
+    category = request.args.get('category')
+    model_type = request.args.get('model_type')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    if category:
+        query = query.where(ForecastData.category == category)
+    if model_type:
+        query = query.where(ForecastData.model_type == model_type)
+    if start_date:
+        query = query.where(ForecastData.forecast_date >= start_date)
+    if end_date:
+        query = query.where(ForecastData.forecast_date <= end_date)
+    query = query.order_by(ForecastData.category, ForecastData.model_type, ForecastData.forecast_date)
+
+    writers = {'ndjson': export_ndjson, 'csv': export_csv, 'arrow': export_arrow}
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = Response(stream_with_context(writers[export_format](export_batches(query))), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=forecasts.{extension}'
+    # Keep reverse proxies from buffering the whole export
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
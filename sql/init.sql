@@ -23,6 +23,8 @@ CREATE TABLE IF NOT EXISTS upload_metadata (
 ) ENGINE=InnoDB;
 
 -- Invoice/Sales Data Table (cleaned data with composite PK)
+-- Partitioned by year of `date` so old years can be dropped or archived (init_db.py keeps future
+-- partitions in place); idx_category_date covers the per-category date-range reads and rollup sums
 CREATE TABLE IF NOT EXISTS invoice_data (
     date DATE NOT NULL,
     product_id VARCHAR(100) NOT NULL,
@@ -35,24 +37,116 @@ CREATE TABLE IF NOT EXISTS invoice_data (
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     version INT DEFAULT 1,
     PRIMARY KEY (date, product_id, category),
-    INDEX idx_date (date),
-    INDEX idx_category (category),
-    INDEX idx_batch (batch_num)
+    INDEX idx_category_date (category, date, product_id, sales),
+    INDEX idx_batch_keys (batch_num, category, date)
+) ENGINE=InnoDB
+PARTITION BY RANGE COLUMNS(date) (
+    PARTITION p_min VALUES LESS THAN ('2020-01-01'),
+    PARTITION p2020 VALUES LESS THAN ('2021-01-01'),
+    PARTITION p2021 VALUES LESS THAN ('2022-01-01'),
+    PARTITION p2022 VALUES LESS THAN ('2023-01-01'),
+    PARTITION p2023 VALUES LESS THAN ('2024-01-01'),
+    PARTITION p2024 VALUES LESS THAN ('2025-01-01'),
+    PARTITION p2025 VALUES LESS THAN ('2026-01-01'),
+    PARTITION p2026 VALUES LESS THAN ('2027-01-01'),
+    PARTITION p2027 VALUES LESS THAN ('2028-01-01'),
+    PARTITION p_max VALUES LESS THAN (MAXVALUE)
+);
+
+-- Daily category totals (rollup of invoice_data, maintained incrementally by the ETL worker)
+CREATE TABLE IF NOT EXISTS daily_category_sales (
+    category VARCHAR(100) NOT NULL,
+    date DATE NOT NULL,
+    sales DECIMAL(14,2) NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (category, date),
+    INDEX idx_date (date)
 ) ENGINE=InnoDB;
 
 -- Forecast Data Table (category-wise only)
+-- Partitioned by year of forecast_date, which therefore has to be part of the primary key
 CREATE TABLE IF NOT EXISTS forecast_data (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
     forecast_date DATE NOT NULL,
     category VARCHAR(100) NOT NULL,
-    model_type ENUM('prophet','sarimax','holt_winters') NOT NULL,
+    model_type ENUM('prophet','sarimax','holt_winters','seasonal_naive','reconciled') NOT NULL,
     forecast_value DECIMAL(12,2) NOT NULL,
     lower_bound DECIMAL(12,2),
     upper_bound DECIMAL(12,2),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     batch_num VARCHAR(100),
+    PRIMARY KEY (id, forecast_date),
     UNIQUE KEY unique_forecast (forecast_date, category, model_type),
     INDEX idx_forecast_date (forecast_date),
-    INDEX idx_model (model_type),
-    INDEX idx_category (category)
+    INDEX idx_category_model_date (category, model_type, forecast_date)
+) ENGINE=InnoDB
+PARTITION BY RANGE COLUMNS(forecast_date) (
+    PARTITION p_min VALUES LESS THAN ('2020-01-01'),
+    PARTITION p2020 VALUES LESS THAN ('2021-01-01'),
+    PARTITION p2021 VALUES LESS THAN ('2022-01-01'),
+    PARTITION p2022 VALUES LESS THAN ('2023-01-01'),
+    PARTITION p2023 VALUES LESS THAN ('2024-01-01'),
+    PARTITION p2024 VALUES LESS THAN ('2025-01-01'),
+    PARTITION p2025 VALUES LESS THAN ('2026-01-01'),
+    PARTITION p2026 VALUES LESS THAN ('2027-01-01'),
+    PARTITION p2027 VALUES LESS THAN ('2028-01-01'),
+    PARTITION p_max VALUES LESS THAN (MAXVALUE)
+);
+
+-- Fitted model parameters per category, reused to warm-start later forecast batches
+CREATE TABLE IF NOT EXISTS model_state (
+    category VARCHAR(100) NOT NULL,
+    model_type ENUM('sarimax','holt_winters') NOT NULL,
+    params TEXT NOT NULL,
+    nobs INT NOT NULL,
+    last_date DATE NOT NULL,
+    residual_std DOUBLE,
+    full_fit_at DATETIME NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (category, model_type)
+) ENGINE=InnoDB;
+
+-- Content hash of the daily series behind each category's last saved forecast
+CREATE TABLE IF NOT EXISTS forecast_fingerprint (
+    category VARCHAR(100) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    batch_num VARCHAR(100),
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+-- Rolling-origin backtest accuracy and fit cost per model and category (forecast_service/backtest.py)
+CREATE TABLE IF NOT EXISTS model_backtest (
+    category VARCHAR(100) NOT NULL,
+    model_type ENUM('prophet','sarimax','holt_winters','seasonal_naive') NOT NULL,
+    folds INT NOT NULL,
+    failed_folds INT NOT NULL DEFAULT 0,
+    horizon INT NOT NULL,
+    mape DOUBLE,
+    rmse DOUBLE,
+    fit_seconds DOUBLE,
+    evaluated_at DATETIME NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (category, model_type)
+) ENGINE=InnoDB;
+
+-- Product-level forecasts reconciled with the category forecast (forecast_service/hierarchy.py)
+CREATE TABLE IF NOT EXISTS product_forecast_data (
+    category VARCHAR(100) NOT NULL,
+    product_id VARCHAR(100) NOT NULL,
+    forecast_date DATE NOT NULL,
+    forecast_value DECIMAL(12,2) NOT NULL,
+    lower_bound DECIMAL(12,2),
+    upper_bound DECIMAL(12,2),
+    reconciliation ENUM('bottom_up','mint') NOT NULL,
+    batch_num VARCHAR(100),
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (category, product_id, forecast_date)
+) ENGINE=InnoDB;
+
+-- Partitions of a partitioned upload whose load has committed; guards against redelivered jobs
+CREATE TABLE IF NOT EXISTS etl_partition_ledger (
+    batch_num VARCHAR(100) NOT NULL,
+    partition_num INT NOT NULL,
+    committed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (batch_num, partition_num)
 ) ENGINE=InnoDB;